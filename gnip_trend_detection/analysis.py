@@ -10,19 +10,25 @@ import datetime_truncate
 from math import log10, floor
 from dateutil.parser import parse as dt_parser
 
+import numpy as np
+
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.dates as mdates
 import matplotlib.ticker as plticker
 import matplotlib.pyplot as plt
 
-from .time_bucket import TimeBucket
+from .binning import to_epoch, from_epoch, SparseSeries
+from .time_bucket import TimeBucket, TimeBucketArray
+from .timestamps import TimestampParser
+from .models import get_state, set_state
 
 def rebin(input_generator,
         start_time = str(datetime.datetime(1970,1,1)),
         stop_time = str(datetime.datetime(2020,1,1)),
         binning_unit = 'hours',
         n_binning_unit = 1,
+        sparse = False,
         **kwargs
         ):
     """
@@ -33,158 +39,343 @@ def rebin(input_generator,
         n_binning_unit
         stop_time
         start_time
+        sparse
 
     The 'input_generator' object must yield tuples like:
         [interval start time], [interval duration in sec], [interval count]
 
     The function return a list of tuples like:
         [new interval start time], [new interval duration in sec], [new interval count]
+    If 'sparse' is True, a binning.SparseSeries is returned instead, 
+    which holds only the occupied bins. Use its 'to_dense_tuples' method 
+    to get a contiguous series.
     """
     
     logger = logging.getLogger("rebin")
     
     start_time = dt_parser(start_time)  
     stop_time = dt_parser(stop_time)  
+    time_parser = TimestampParser()
 
-    # these are just for keeping track of what range of date/times we observe in the data
-    max_stop_time = datetime.datetime(1970,1,1)
-    min_start_time = datetime.datetime(2020,1,1)
-
-    input_data = []
+    start_epochs = []
+    durations = []
+    counts = []
 
-    # put the data into a list of (TimeBucket, count) tuples
+    # put the data into columns of start times, durations, and counts
     for line in input_generator:
         
         try:
-            this_start_time = dt_parser(line[0])
+            this_start_time = time_parser(line[0])
         except ValueError:
             continue
-        dt = datetime.timedelta(seconds=int(float(line[1])))
-        this_stop_time = this_start_time + dt
-       
-        if this_stop_time > stop_time:
+        start_epochs.append(to_epoch(this_start_time))
+        durations.append(int(float(line[1])))
+        counts.append(float(line[2]))
+
+    start_epochs = np.array(start_epochs,dtype=float)
+    input_buckets = TimeBucketArray(start_epochs,start_epochs + np.array(durations,dtype=float))
+    counts = np.array(counts,dtype=float)
+    
+    series_ids = np.zeros(len(counts),dtype=np.int64)
+    output_data = rebin_columns(input_buckets,counts,series_ids,1,start_time,stop_time,binning_unit,n_binning_unit)[0]
+    if sparse:
+        return output_data
+    return output_data.to_tuples()
+
+def rebin_many(input_generator,
+        counters = None,
+        start_time = str(datetime.datetime(1970,1,1)),
+        stop_time = str(datetime.datetime(2020,1,1)),
+        binning_unit = 'hours',
+        n_binning_unit = 1,
+        sparse = False,
+        **kwargs
+        ):
+    """
+    Rebin the data for many counters in a single pass, on a single grid.
+    
+    The 'input_generator' object must yield tuples like:
+        [interval start time], [interval duration in sec], [interval count], [counter name]
+    Tuples without a counter name are skipped, as are tuples for counters that
+    are not in 'counters', if specified. 
+
+    Other keyword arguments are as for 'rebin'.
+    The function returns a dictionary of counter name to a list of tuples like 'rebin' returns,
+    or to a binning.SparseSeries if 'sparse' is True.
+    Because the grid is shared, its origin is set by the earliest interval for any counter.
+    """
+    
+    logger = logging.getLogger("rebin")
+    
+    start_time = dt_parser(start_time)  
+    stop_time = dt_parser(stop_time)  
+    time_parser = TimestampParser()
+    if counters is not None:
+        counters = set(counters)
+
+    # map counter names to integer series ids
+    series_id_map = {}
+    series_ids = []
+    start_epochs = []
+    durations = []
+    counts = []
+
+    for line in input_generator:
+        try:
+            counter_name = line[3] 
+        except IndexError:
+            logger.debug("no 4th field in " + str(line))
             continue
-        if this_start_time < start_time:
+        if counters is not None and counter_name not in counters:
             continue
-        time_bucket = TimeBucket(this_start_time, this_stop_time)  
-        
-        count = line[2]
-        input_data.append((time_bucket, count)) 
-        
-        if this_stop_time > max_stop_time:
-            max_stop_time = this_stop_time
-        if this_start_time < min_start_time:
-            min_start_time = this_start_time
+        try:
+            this_start_time = time_parser(line[0])
+        except ValueError:
+            continue
+        if counter_name not in series_id_map:
+            series_id_map[counter_name] = len(series_id_map)
+        series_ids.append(series_id_map[counter_name])
+        start_epochs.append(to_epoch(this_start_time))
+        durations.append(int(float(line[1])))
+        counts.append(float(line[2]))
+
+    start_epochs = np.array(start_epochs,dtype=float)
+    input_buckets = TimeBucketArray(start_epochs,start_epochs + np.array(durations,dtype=float))
+    counts = np.array(counts,dtype=float)
+    series_ids = np.array(series_ids,dtype=np.int64)
+
+    output_data = rebin_columns(input_buckets,counts,series_ids,len(series_id_map),start_time,stop_time,binning_unit,n_binning_unit)
+    if sparse:
+        return {counter_name:output_data[series_id] for counter_name,series_id in series_id_map.items()}
+    return {counter_name:output_data[series_id].to_tuples() for counter_name,series_id in series_id_map.items()}
+
+def rebin_columns(input_buckets, counts, series_ids, n_series, start_time, stop_time, binning_unit, n_binning_unit):
+    """
+    Rebin columnar data for one or more series onto a single grid. 
+    'input_buckets' is a TimeBucketArray, 'counts' is an array of the corresponding counts,
+    and 'series_ids' is an array of integers in [0,n_series) that assigns each interval to a series.
+    'start_time' and 'stop_time' are datetimes. 
+    Returns a list, indexed by series id, of binning.SparseSeries objects.
+    """
+    keep = input_buckets.is_in(TimeBucket(start_time,stop_time))
+    order = np.argsort(input_buckets.start[keep],kind='stable')
+    input_buckets = input_buckets[keep][order]
+    counts = counts[keep][order]
+    series_ids = series_ids[keep][order]
 
-    input_data_sorted = sorted(input_data)
+    # these are just for keeping track of what range of date/times we observe in the data
+    if len(input_buckets) > 0:
+        min_start_time = from_epoch(input_buckets.start.min())
+        max_stop_time = from_epoch(input_buckets.stop.max())
+    else:
+        max_stop_time = datetime.datetime(1970,1,1)
+        min_start_time = datetime.datetime(2020,1,1)
 
     # make a grid with appropriate bin size
     grid_start_time = datetime_truncate.truncate(min_start_time,binning_unit.rstrip('s'))
     grid_stop_time = datetime_truncate.truncate(max_stop_time,binning_unit.rstrip('s'))
     grid_dt = datetime.timedelta(**{binning_unit:int(n_binning_unit)})
 
-    tb_stop_time = grid_start_time + grid_dt
-    tb = TimeBucket(grid_start_time,tb_stop_time)
-
-    # make list of TimeBuckets for bins
-    grid = []
-    while tb.stop_time <= grid_stop_time:
-        #logger.debug("{}".format(tb))
-        grid.append(tb)
-        tb_start_time = tb.stop_time
-        tb_stop_time = tb_start_time + grid_dt
-        tb = TimeBucket(tb_start_time,tb_stop_time) 
-    grid.append(tb)
-
-
-    # add data to a dictionary with keys mapped to the grid indicies
-    output_data = collections.defaultdict(float)
-    for input_tb,input_count in input_data_sorted:
-        logger.debug("input. TB: {}, count: {}".format(input_tb,input_count))
-       
-        for grid_tb in grid:
-            if input_tb in grid_tb:
-                idx = grid.index(grid_tb) 
-                output_data[idx] += float(input_count)
-                break
-            elif input_tb.intersects(grid_tb):
-                # assign partial count of input_tb to grid_tb
-                idx_lower = grid.index(grid_tb) 
-                frac_lower = input_tb.get_fraction_overlapped_by(grid_tb)  
-                output_data[idx_lower] += (float(input_count) * frac_lower)
-                
-                try:
-                    idx = idx_lower + 1
-                    frac = input_tb.get_fraction_overlapped_by(grid[idx])  
-                    while frac > 0:
-                        output_data[idx] += (frac * float(input_count))
-                        idx += 1
-                        frac = input_tb.get_fraction_overlapped_by(grid[idx])   
-                except IndexError:
-                    pass
-                
-                break
-            else:
-                pass
+    # the grid is uniform, so bin 'idx' covers [grid_start_time + idx*grid_dt, grid_start_time + (idx+1)*grid_dt) 
+    n_grid = max((grid_stop_time - grid_start_time)//grid_dt + 1, 1)
+
+    # accumulate counts for the filled (series, bin) pairs only;
+    # these are the occupied entries of a (series x grid) matrix, in row-major order
+    row, idx, frac = input_buckets.grid_overlaps(to_epoch(grid_start_time),grid_dt.total_seconds())
+    in_grid = idx < n_grid
+    row = row[in_grid]
+    idx = idx[in_grid]
+    flat_idx, inverse = np.unique(series_ids[row]*n_grid + idx,return_inverse=True)
+    output_data = np.bincount(inverse.ravel(),weights=counts[row]*frac[in_grid],minlength=len(flat_idx))
+
+    # split into series; index each series from its first filled bin, 
+    # so that the output is as if the series were rebinned on its own
+    boundaries = np.searchsorted(flat_idx,np.arange(n_series+1)*n_grid)
+    max_stop_epochs = np.zeros(n_series)
+    np.maximum.at(max_stop_epochs,series_ids,input_buckets.stop)
+    output = []
+    for series_id,(lower,upper) in enumerate(zip(boundaries[:-1],boundaries[1:])):
+        if upper == lower:
+            output.append(SparseSeries(grid_start_time,grid_dt,0,[],[]))
+            continue
+        first_idx = int(flat_idx[lower]) - series_id*n_grid
+        series_start_time = grid_start_time + first_idx*grid_dt
+        series_stop_time = datetime_truncate.truncate(from_epoch(max_stop_epochs[series_id]),binning_unit.rstrip('s'))
+        output.append(SparseSeries(series_start_time,
+                grid_dt,
+                max((series_stop_time - series_start_time)//grid_dt + 1, 1),
+                flat_idx[lower:upper] - series_id*n_grid - first_idx,
+                output_data[lower:upper]))
+    return output
+
+def rebin_stream(input_generator,
+        start_time = str(datetime.datetime(1970,1,1)),
+        stop_time = str(datetime.datetime(2020,1,1)),
+        binning_unit = 'hours',
+        n_binning_unit = 1,
+        lateness = 0,
+        chunk_size = 1000,
+        **kwargs
+        ):
+    """
+    Streaming version of 'rebin', with bounded memory.
+    Input and output tuples are as for 'rebin', but output tuples
+    are yielded as soon as no further input can land in the corresponding bin.
 
-    # put data back into a sorted list of tuples
-    sorted_output_data = []
+    The input must be time-ordered, except that an interval may arrive up to
+    'lateness' seconds (of interval start time) after a later interval.
+    Input that is later than this is dropped. The grid is aligned
+    to the truncated start time of the first input interval, less 'lateness'.
 
-    # use these to strip off leading and trailing zero-count entries
-    prev_count = 0
-    last_non_zero_ct_idx = -1
+    Input is processed in chunks of 'chunk_size' lines.
+    """
 
-    # the grid is already time ordered, and the output_data are indexed
-    for idx,dt in enumerate(grid):
-        if idx in output_data:
-            count = output_data[idx]
-            last_non_zero_ct_idx = idx
-        else:
-            count = 0
-        if count != 0 or prev_count != 0:
+    logger = logging.getLogger("rebin")
 
-            if count > 0:
-                trimmed_count = int(count)
-                #trimmed_count = round(count, -int(floor(log10(count)))+1) 
-            else:
-                trimmed_count = 0
-            sorted_output_data.append((str(dt.start_time),dt.size().total_seconds(),trimmed_count)) 
-        
-        prev_count = count
-    sorted_output_data = sorted_output_data[:last_non_zero_ct_idx+1]
-    
-    # return the data structure
-    return sorted_output_data
-    
-def analyze(generator, model): 
-    """
-    This function acts on CSV data for a single counter.
-    It loops over the items generated by the first argument.
-    Each item is expected to be a tuple of: 
-        [interval_start_time] [interval_duration_in_sec] [interval_count] 
-    Each count is used to update the model, and the model result is added to the return list. 
-    """
-    
+    start_epoch = to_epoch(dt_parser(start_time))
+    stop_epoch = to_epoch(dt_parser(stop_time))
+    time_parser = TimestampParser()
+    lateness = float(lateness)
+    chunk_size = int(chunk_size)
+    grid_dt = datetime.timedelta(**{binning_unit:int(n_binning_unit)})
+    grid_dt_sec = grid_dt.total_seconds()
+
+    # grid is defined when the first line arrives
+    grid_start_time = None
+    grid_start = None
+
+    # counts for bins that may still receive input, keyed by grid index
+    open_bins = collections.defaultdict(float)
+    # index of the next bin to be yielded
+    next_idx = None
+    max_start_epoch = None
+    max_stop_epoch = None
+    n_dropped = 0
+
+    # state for stripping leading/trailing zero-count entries, as in 'rebin'
+    prev_count = 0
+    held_zero_idx = None
+    n_output = 0
+    # indexes of the first and last bins that received input, even with a count of zero
+    first_hit_idx = None
+    last_hit_idx = None
+
+    def finished_bins(stop_idx):
+        """ yield output tuples for all bins before 'stop_idx' """
+        nonlocal next_idx, prev_count, held_zero_idx, n_output
+        while next_idx < stop_idx:
+            if next_idx not in open_bins and prev_count == 0:
+                # skip ahead over a run of empty bins
+                filled = [idx for idx in open_bins if idx < stop_idx]
+                next_idx = min(filled) if filled != [] else stop_idx
+                continue
+            count = open_bins.pop(next_idx,0)
+            if count != 0:
+                if held_zero_idx is not None:
+                    yield (str(grid_start_time + held_zero_idx*grid_dt),grid_dt_sec,0)
+                    held_zero_idx = None
+                    n_output += 1
+                trimmed_count = int(count) if count > 0 else 0
+                yield (str(grid_start_time + next_idx*grid_dt),grid_dt_sec,trimmed_count)
+                n_output += 1
+            elif prev_count != 0:
+                # only output a zero-count bin if a non-zero bin follows
+                held_zero_idx = next_idx
+            prev_count = count
+            next_idx += 1
+
+    def process(chunk):
+        nonlocal grid_start_time, grid_start, next_idx, max_start_epoch, max_stop_epoch, n_dropped
+        nonlocal first_hit_idx, last_hit_idx
+        start_epochs = np.array([tup[0] for tup in chunk],dtype=float)
+        input_buckets = TimeBucketArray(start_epochs,start_epochs + np.array([tup[1] for tup in chunk],dtype=float))
+        counts = np.array([tup[2] for tup in chunk],dtype=float)
+
+        if grid_start is None:
+            grid_start_time = datetime_truncate.truncate(from_epoch(start_epochs[0] - lateness),binning_unit.rstrip('s'))
+            grid_start = to_epoch(grid_start_time)
+            next_idx = 0
+            max_start_epoch = start_epochs[0]
+            max_stop_epoch = input_buckets.stop[0]
+
+        row, idx, frac = input_buckets.grid_overlaps(grid_start,grid_dt_sec)
+        is_late = idx < next_idx
+        n_dropped += len(np.unique(row[is_late]))
+        for i,weight in zip(idx[~is_late].tolist(),(counts[row]*frac)[~is_late].tolist()):
+            open_bins[i] += weight
+        if (~is_late).any():
+            hit_idx = idx[~is_late]
+            first_hit_idx = int(hit_idx.min()) if first_hit_idx is None else min(first_hit_idx,int(hit_idx.min()))
+            last_hit_idx = int(hit_idx.max()) if last_hit_idx is None else max(last_hit_idx,int(hit_idx.max()))
+            max_stop_epoch = max(max_stop_epoch,input_buckets.stop[np.unique(row[~is_late])].max())
+        max_start_epoch = max(max_start_epoch,start_epochs.max())
+
+    chunk = []
+    for line in input_generator:
+        try:
+            this_start_epoch = to_epoch(time_parser(line[0]))
+        except ValueError:
+            continue
+        duration = int(float(line[1]))
+        if this_start_epoch + duration > stop_epoch:
+            continue
+        if this_start_epoch < start_epoch:
+            continue
+        chunk.append((this_start_epoch,duration,float(line[2])))
+
+        if len(chunk) >= chunk_size:
+            process(chunk)
+            chunk = []
+            # no future input can start before this time
+            watermark = max_start_epoch - lateness
+            for tup in finished_bins(int((watermark - grid_start)//grid_dt_sec)):
+                yield tup
+
+    if chunk != []:
+        process(chunk)
+    if last_hit_idx is not None:
+        for tup in finished_bins(last_hit_idx + 1):
+            yield tup
+        # a non-zero last bin is followed by a zero-count bin, if the grid extends past it
+        grid_stop_time = datetime_truncate.truncate(from_epoch(max_stop_epoch),binning_unit.rstrip('s'))
+        if prev_count != 0 and grid_start_time + (last_hit_idx + 1)*grid_dt <= grid_stop_time:
+            held_zero_idx = last_hit_idx + 1
+        # as in 'rebin', the number of output tuples is limited by
+        # the index of the last occupied bin, counted from the first
+        if held_zero_idx is not None and n_output <= last_hit_idx - first_hit_idx:
+            yield (str(grid_start_time + held_zero_idx*grid_dt),grid_dt_sec,0)
+
+    if n_dropped > 0:
+        logger.warning("dropped {} input intervals that arrived later than the lateness window".format(n_dropped))
+
+def get_analyze_logger():
     logger = logging.getLogger("analyze") 
     if logger.handlers == []:
         fmtr = logging.Formatter('%(asctime)s %(name)s:%(lineno)s - %(levelname)s - %(message)s') 
         hndlr = logging.StreamHandler()
         hndlr.setFormatter(fmtr)
         logger.addHandler(hndlr) 
+    return logger
 
-    output_data = [] 
+def parse_counts(generator):
+    """ Return lists of the interval start times and the counts in the items generated for 'analyze' """
+    time_parser = TimestampParser()
+    time_interval_starts = []
+    counts = []
     for line in generator:
         try:
-            time_interval_start = dt_parser(line[0]) 
+            time_interval_starts.append(time_parser(line[0]))
         except ValueError:
             print(line[0])
             sys.exit()
-        time_interval_duration = line[1]
-        count = float(line[2])
-        
-        model.update(count=count, interval_start_time=time_interval_start) 
-        result = float(model.get_result())
-        
+        counts.append(float(line[2]))
+    return time_interval_starts, counts
+
+def format_results(time_interval_starts, counts, results):
+    """ Return the output of 'analyze' for a counter's model results """
+    logger = get_analyze_logger()
+    output_data = [] 
+    for time_interval_start,count,result in zip(time_interval_starts,counts,results):
         # trim digits in outputs
         if count > 0:
             trimmed_count = round(count, -int(floor(log10(count)))+1) 
@@ -200,6 +391,132 @@ def analyze(generator, model):
     
     return output_data
 
+def analyze(generator, model, after=None):
+    """
+    This function acts on CSV data for a single counter.
+    It loops over the items generated by the first argument.
+    Each item is expected to be a tuple of: 
+        [interval_start_time] [interval_duration_in_sec] [interval_count] 
+    Each count is used to update the model, and the model result is added to the return list. 
+    Models that implement 'update_many' are updated with all the counts at once.
+    If 'after' is a datetime, items with interval start times up to and including it are skipped,
+    as for a model restored from a checkpoint taken at that time.
+    """
+    
+    time_interval_starts, counts = parse_counts(generator)
+    if after is not None:
+        new_items = [i for i,time_interval_start in enumerate(time_interval_starts) if time_interval_start > after]
+        time_interval_starts = [time_interval_starts[i] for i in new_items]
+        counts = [counts[i] for i in new_items]
+        
+    # use the batch interface if the model has one
+    if hasattr(model,"update_many"):
+        model.update_many(counts=counts, interval_start_times=time_interval_starts) 
+        results = [float(result) for result in model.get_results()]
+    else:
+        results = []
+        for count,time_interval_start in zip(counts,time_interval_starts):
+            model.update(count=count, interval_start_time=time_interval_start) 
+            results.append(float(model.get_result()))
+        
+    return format_results(time_interval_starts,counts,results)
+
+def analyze_from_checkpoint(generator, model, checkpoint_state=None):
+    """
+    Analyze the data for a single counter as 'analyze' does, resuming from 'checkpoint_state': 
+    a tuple of (start time of the last interval analyzed, model state), as saved in
+    a checkpoint by models.save_checkpoint, or None to start from the beginning.
+    Only items after the last analyzed interval are used.
+    Return the output of 'analyze' for those items, and the new checkpoint state.
+    """
+    after = None
+    if checkpoint_state is not None:
+        after, state = checkpoint_state
+        set_state(model,state)
+    output_data = analyze(generator,model,after=after)
+    if len(output_data) > 0:
+        after = TimestampParser()(output_data[-1][0])
+    return output_data, (after,get_state(model))
+
+def analyze_many(counter_data, models):
+    """
+    Analyze the data for many counters, as 'analyze' does for each one.
+    'counter_data' is a dictionary of counter name to items like 'analyze' takes,
+    and 'models' is a dictionary of counter name to a model instance. 
+    The counters are updated together, one time step (item) at a time.
+    At each step, models whose class implements 'update_counters' are updated together,
+    so that they can share work between counters; other models are updated one by one.
+    Return a dictionary of counter name to the output of 'analyze'.
+    """
+    parsed_data = collections.OrderedDict()
+    for counter,generator in counter_data.items():
+        parsed_data[counter] = parse_counts(generator)
+    results = dict((counter,[]) for counter in parsed_data)
+    
+    n_steps = max([len(counts) for _,counts in parsed_data.values()] + [0])
+    for step in range(n_steps):
+        # group the models by class
+        groups = collections.OrderedDict()
+        for counter,(time_interval_starts,counts) in parsed_data.items():
+            if step < len(counts):
+                model = models[counter]
+                groups.setdefault(type(model),[]).append((model,counts[step],time_interval_starts[step]))
+        for model_class,group in groups.items():
+            if hasattr(model_class,"update_counters"):
+                model_class.update_counters([model for model,_,_ in group],
+                        counts=[count for _,count,_ in group], 
+                        interval_start_times=[time_interval_start for _,_,time_interval_start in group])
+            else:
+                for model,count,time_interval_start in group:
+                    model.update(count=count, interval_start_time=time_interval_start) 
+        for counter,(_,counts) in parsed_data.items():
+            if step < len(counts):
+                results[counter].append(float(models[counter].get_result()))
+
+    output_data = {}
+    for counter,(time_interval_starts,counts) in parsed_data.items():
+        output_data[counter] = format_results(time_interval_starts,counts,results[counter])
+    return output_data
+
+def share_time_steps(counter_data):
+    """ Return True if the items for all the counters in 'counter_data' have the same interval start times """
+    time_steps = None
+    for generator in counter_data.values():
+        counter_time_steps = [line[0] for line in generator]
+        if time_steps is None:
+            time_steps = counter_time_steps
+        elif counter_time_steps != time_steps:
+            return False
+    return True
+
+def analyze_counters(counter_data, engine):
+    """
+    Analyze the data for many counters, as 'analyze' does for each one,
+    with a multi-counter model (such as models.PoissonCounters) that holds 
+    the state of all the counters, in the order of 'counter_data'.
+    The items for all the counters must have the same interval start times.
+    Return a dictionary of counter name to the output of 'analyze'.
+    """
+    if not share_time_steps(counter_data):
+        raise ValueError("the counters don't share time steps")
+    parsed_data = collections.OrderedDict()
+    for counter,generator in counter_data.items():
+        parsed_data[counter] = parse_counts(generator)
+    if len(parsed_data) == 0:
+        return {}
+    time_interval_starts = list(parsed_data.values())[0][0]
+    counts = np.array([counter_counts for _,counter_counts in parsed_data.values()],dtype=float)
+    
+    results = np.zeros(counts.shape)
+    for step,time_interval_start in enumerate(time_interval_starts):
+        engine.update(counts=counts[:,step], interval_start_time=time_interval_start)
+        results[:,step] = engine.get_results()
+
+    output_data = {}
+    for i,(counter,(_,counter_counts)) in enumerate(parsed_data.items()):
+        output_data[counter] = format_results(time_interval_starts,counter_counts,results[i].tolist())
+    return output_data
+
 def plot(input_generator,config):            
     """
     input_generator is a generator of tuples with the following structure:
@@ -238,7 +555,9 @@ def plot(input_generator,config):
     """
 
     # TODO: should just put this in a dataframe
-    data = [(dt_parser(tup[0]),float(tup[1]),float(tup[2])) for tup in input_generator if dt_parser(tup[0]) > start_tm and dt_parser(tup[0]) < stop_tm ]
+    time_parser = TimestampParser()
+    data = [(time_parser(tup[0]),float(tup[1]),float(tup[2])) for tup in input_generator]
+    data = [tup for tup in data if tup[0] > start_tm and tup[0] < stop_tm]
     
     if rebin_factor <= 1:
         tbs = [tup[0] for tup in data]
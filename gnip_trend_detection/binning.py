@@ -0,0 +1,142 @@
+"""
+Columnar re-binning of time series data.
+
+Functions in this module act on NumPy arrays of interval start times
+(in seconds since the Unix epoch), interval durations (in seconds), and counts,
+rather than on lists of TimeBucket objects. The output grid is uniform and
+is defined by its start time and bin size, both in seconds.
+
+Rebinning logic is the same as in analysis.rebin:
+    an input interval contained by a single grid bin assigns its full count to that bin
+    an input interval that overlaps more than one grid bin is assumed to have
+    a constant rate, and its count is split between the bins proportionally
+"""
+
+import datetime
+
+import numpy as np
+
+EPOCH = datetime.datetime(1970,1,1)
+
+def to_epoch(dt):
+    """ Convert a naive datetime to seconds since the Unix epoch """
+    return (dt - EPOCH).total_seconds()
+
+def from_epoch(seconds):
+    """ Convert seconds since the Unix epoch to a naive datetime """
+    return EPOCH + datetime.timedelta(seconds=float(seconds))
+
+def grid_overlap_arrays(start_epochs, durations, grid_start, grid_dt):
+    """
+    Vectorized mapping of input intervals onto a uniform grid.
+
+    Returns three equal-length arrays, with one entry for each (input interval, grid bin) overlap:
+        row: the index of the input interval
+        idx: the index of the grid bin
+        frac: the fraction of the input interval that falls in the grid bin
+    Entries are ordered by input interval, then by grid bin.
+    """
+    start_epochs = np.asarray(start_epochs,dtype=float)
+    stop_epochs = start_epochs + np.asarray(durations,dtype=float)
+
+    first_idx = np.floor((start_epochs - grid_start)/grid_dt).astype(np.int64)
+    last_idx = np.ceil((stop_epochs - grid_start)/grid_dt).astype(np.int64) - 1
+    last_idx = np.maximum(last_idx,first_idx)
+    n_overlaps = last_idx - first_idx + 1
+
+    # expand each input interval into one entry per grid bin that it touches
+    row = np.repeat(np.arange(len(start_epochs)),n_overlaps)
+    offsets = np.arange(len(row)) - np.repeat(np.cumsum(n_overlaps) - n_overlaps,n_overlaps)
+    idx = first_idx[row] + offsets
+
+    bin_start = grid_start + idx*float(grid_dt)
+    bin_stop = bin_start + grid_dt
+    overlap = np.minimum(stop_epochs[row],bin_stop) - np.maximum(start_epochs[row],bin_start)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        frac = overlap / (stop_epochs[row] - start_epochs[row])
+    # intervals contained by a single bin get their full count
+    frac[n_overlaps[row] == 1] = 1.0
+
+    return row, idx, frac
+
+class SparseSeries(object):
+    """
+    Rebinned counts for one series, stored as the occupied bins of a uniform grid. 
+    The grid is described by its start time (a datetime), its bin size (a timedelta),
+    and its number of bins. 'idx' is the increasing array of occupied bin indices,
+    and 'counts' the array of the corresponding counts.
+    """
+    __slots__ = ('grid_start_time','grid_dt','n_bins','idx','counts')
+
+    def __init__(self, grid_start_time, grid_dt, n_bins, idx, counts):
+        self.grid_start_time = grid_start_time
+        self.grid_dt = grid_dt
+        self.n_bins = n_bins
+        self.idx = np.asarray(idx,dtype=np.int64)
+        self.counts = np.asarray(counts,dtype=float)
+
+    def __len__(self):
+        return len(self.idx)
+
+    def __repr__(self):
+        return "SparseSeries({} of {} bins occupied, starting {}, bin size {})".format(
+                len(self),self.n_bins,self.grid_start_time,self.grid_dt)
+
+    def bin_start_time(self, idx):
+        return self.grid_start_time + int(idx)*self.grid_dt
+
+    def densify(self):
+        """ Return an array of counts for every bin of the grid """
+        dense = np.zeros(self.n_bins)
+        dense[self.idx] = self.counts
+        return dense
+
+    def to_dense_tuples(self):
+        """ 
+        Return a list of (bin start time, bin size in sec, count) tuples for every bin 
+        between the first and last occupied bins, for models that need a contiguous series.
+        """
+        if len(self) == 0:
+            return []
+        grid_dt_sec = self.grid_dt.total_seconds()
+        first_idx = int(self.idx[0])
+        counts = self.densify()[first_idx:int(self.idx[-1])+1]
+        return [(str(self.bin_start_time(first_idx + i)),grid_dt_sec,int(count) if count > 0 else 0) 
+                for i,count in enumerate(counts.tolist())]
+
+    def to_tuples(self):
+        """
+        Return the list of (bin start time, bin size in sec, count) tuples 
+        that 'analysis.rebin' returns. Leading and trailing empty bins are stripped, 
+        and a run of empty bins after a non-zero bin is represented by a single zero-count bin.
+        """
+        # put data back into a sorted list of tuples
+        sorted_output_data = []
+        grid_dt_sec = self.grid_dt.total_seconds()
+
+        # use these to strip off leading and trailing zero-count entries
+        prev_count = 0
+        prev_idx = None
+
+        # the occupied bins are time ordered
+        for idx,count in zip(self.idx.tolist(),self.counts.tolist()):
+            if prev_idx is not None and idx > prev_idx + 1:
+                # empty bins since the previous occupied bin
+                if prev_count != 0:
+                    sorted_output_data.append((str(self.bin_start_time(prev_idx+1)),grid_dt_sec,0))
+                prev_count = 0
+            if count != 0 or prev_count != 0:
+                if count > 0:
+                    trimmed_count = int(count)
+                else:
+                    trimmed_count = 0
+                sorted_output_data.append((str(self.bin_start_time(idx)),grid_dt_sec,trimmed_count)) 
+            prev_count = count
+            prev_idx = idx
+        
+        if prev_idx is None:
+            return []
+        if prev_count != 0 and prev_idx + 1 < self.n_bins:
+            sorted_output_data.append((str(self.bin_start_time(prev_idx+1)),grid_dt_sec,0))
+        
+        return sorted_output_data[:prev_idx+1]
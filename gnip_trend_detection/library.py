@@ -3,6 +3,13 @@ import os
 import math
 import collections
 import random
+import json
+import importlib
+
+import numpy as np
+
+from .ring_buffer import RingBuffer
+from .utils import config_flag
 
 class TopicSeries(list):
     """
@@ -52,6 +59,11 @@ class Library(object):
         self.test_transformations.append(unit_normalization)
         self.test_transformations.append(logarithmic_scaling)
         self.test_transformations.append(smoothing)
+
+        # optionally, use the equivalent NumPy implementations
+        if use_vectorized_transformations(self.config):
+            self.transformations = vectorize(self.transformations)
+            self.test_transformations = vectorize(self.test_transformations)
        
     def add_reference_series(self,series,is_trend=True):
         """
@@ -59,7 +71,7 @@ class Library(object):
         after transforming it 
         """
         self.config["is_trend"] = is_trend
-        series = self.transform_input(series,is_test_series=False) 
+        series = as_list(self.transform_input(series,is_test_series=False))
         if is_trend:
             self.trends.append( TopicSeries(series) )
         else:
@@ -74,6 +86,8 @@ class Library(object):
         transformations = self.transformations
         if is_test_series:
             transformations = self.test_transformations
+        if use_vectorized_transformations(config if config is not None else self.config):
+            transformations = vectorize(transformations)
         
         for transformation in transformations:
             if config is not None:
@@ -83,6 +97,41 @@ class Library(object):
 
         return series
 
+    def get_reference_matrix(self, is_trend=True):
+        """
+        Return the (transformed) trend or non-trend reference series 
+        as the rows of a 2-D array. Shorter series are padded at the end with NaN.
+        """
+        references = self.trends if is_trend else self.non_trends
+        length = max([len(series) for series in references] + [0])
+        matrix = np.full((len(references),length),np.nan)
+        for i,series in enumerate(references):
+            matrix[i,:len(series)] = series
+        return matrix
+
+    def get_incremental_test_transform(self, config, series_length):
+        """
+        Return an IncrementalTestTransform that is equivalent to the test transformations,
+        or None if the test transformations or the configuration aren't supported
+        """
+        if vectorize(self.test_transformations) != vectorize([add_one,unit_normalization,logarithmic_scaling,smoothing]):
+            return None
+        try:
+            transform = IncrementalTestTransform(config,series_length)
+        except KeyError:
+            return None
+        # only windows that end before the latest point are supported
+        if not 0 < transform.offset < transform.reference_length:
+            return None
+        return transform
+
+    def get_reference_windows(self, is_trend, series_length):
+        """
+        Return precomputed "series_length"-sized subseries of the reference series,
+        as the rows of a 2-D array, or None if there aren't any
+        """
+        return None
+
     def combine(self, lib):
         """
         Manage all attributes of class that are important for combinations. 
@@ -96,6 +145,131 @@ class Library(object):
             assert self.non_trends == []
             self.non_trends = lib.non_trends
 
+class ArrayLibrary(Library):
+    """
+    Read-only Library whose reference series are held in 2-D arrays, 
+    which may be memory-mapped. Use 'load_array_library' to load one from disk.
+    """
+    def __init__(self, trend_matrix, non_trend_matrix, config, 
+            transformations, test_transformations, windows = None, series_length = None):
+        # 'Library.__init__' is not called, since the reference series and 
+        # transformations come from the saved arrays and header; 
+        # its attributes are set here instead
+        self.trend_matrix = trend_matrix
+        self.non_trend_matrix = non_trend_matrix
+        self.config = {"reference_length":210,"n_smooth":80,"alpha":1.2}
+        self.config.update(config)
+        self.transformations = transformations
+        self.test_transformations = test_transformations
+        # lists of TopicSeries, built from the matrices on first access
+        self._trends = None
+        self._non_trends = None
+        # precomputed subseries, keyed by "is_trend"
+        self.windows = windows if windows is not None else {}
+        self.series_length = series_length
+
+    def get_series(self, matrix):
+        return [TopicSeries(row[~np.isnan(row)].tolist()) for row in matrix]
+
+    @property
+    def trends(self):
+        if self._trends is None:
+            self._trends = self.get_series(self.trend_matrix)
+        return self._trends
+
+    @property
+    def non_trends(self):
+        if self._non_trends is None:
+            self._non_trends = self.get_series(self.non_trend_matrix)
+        return self._non_trends
+
+    def add_reference_series(self, series, is_trend=True):
+        raise TypeError("array libraries are read-only; add series to a Library, and save it with 'save_array_library'")
+
+    def get_reference_matrix(self, is_trend=True):
+        return self.trend_matrix if is_trend else self.non_trend_matrix
+
+    def get_reference_windows(self, is_trend, series_length):
+        if series_length != self.series_length:
+            return None
+        return self.windows.get(is_trend)
+
+class IncrementalTestTransform(object):
+    """
+    Incremental version of the default test transformations 
+    (add_one, unit_normalization, logarithmic_scaling, smoothing),
+    for the latest "reference_length" points of a series that grows one point at a time. 
+    
+    Since log10(pt/total) = log10(pt) - log10(total), the logarithms of the points are 
+    calculated once, and each test series is built from smoothed logarithms 
+    and the logarithm of the running normalization total.
+    Results agree with Library.transform_input to within rounding.
+    """
+    # attributes saved in model checkpoints
+    state_attributes = ["points","logs","n_invalid","norm_sum","n_since_reset"]
+
+    def __init__(self, config, series_length):
+        self.reference_length = int(config["reference_length"])
+        self.offset = int(config["baseline_offset"])
+        self.n_smooth = max(int(config["n_smooth"]),1)
+        self.series_length = min(series_length,self.reference_length)
+        self.SMALL_NUMBER = 0.00001
+        self.RESET_INTERVAL = 1000
+
+        self.points = RingBuffer(self.reference_length)
+        # NaN marks points that can't be log-scaled before normalization
+        self.logs = RingBuffer(self.reference_length)
+        self.n_invalid = 0
+        # running sum of the points in the normalization window 
+        self.norm_sum = 0.
+        self.n_since_reset = 0
+
+        # moving averages over up to "n_smooth" points, as in 'smoothing',
+        # from cumulative sums of the logarithms
+        idx = np.arange(self.reference_length - self.series_length,self.reference_length)
+        self.upper_idx = idx + 1
+        self.lower_idx = np.maximum(idx + 1 - self.n_smooth,0)
+        self.smoothing_lengths = (self.upper_idx - self.lower_idx).astype(float)
+
+    def append(self, count):
+        """ Add the latest count """
+        pt = count + 1
+        # the normalization window ends "offset" points before the latest point
+        n = len(self.points)
+        if n >= self.offset:
+            self.norm_sum += self.points[n - self.offset]
+        if n >= self.reference_length:
+            self.norm_sum -= self.points[0]
+            if self.points[0] <= 0:
+                self.n_invalid -= 1
+        self.points.append(pt)
+        if pt > 0:
+            self.logs.append(math.log10(pt))
+        else:
+            self.logs.append(np.nan)
+            self.n_invalid += 1
+
+        self.n_since_reset += 1
+        if self.n_since_reset >= self.RESET_INTERVAL:
+            # remove accumulated rounding error
+            self.norm_sum = float(sum(self.points[:max(0,len(self.points) - self.offset)].tolist()))
+            self.n_since_reset = 0
+
+    def get_test_series(self):
+        """
+        Return the transformed test series for the latest "reference_length" points,
+        or None if it can't be calculated incrementally
+        """
+        if len(self.points) < self.reference_length or self.n_invalid > 0:
+            return None
+        total = self.norm_sum/float(self.reference_length)
+        if total == 0:
+            total = self.SMALL_NUMBER
+
+        cumulative_logs = np.concatenate(([0.],np.cumsum(self.logs.values())))
+        smoothed_logs = (cumulative_logs[self.upper_idx] - cumulative_logs[self.lower_idx])/self.smoothing_lengths
+        return smoothed_logs - math.log10(total)
+
 def add_one(series, config):
     """ Add a count of 1 to every count in the series """
     return [ ct+1 for ct in series ]
@@ -173,14 +347,180 @@ def sizing(series, config):
     new_series = series[-int(config["reference_length"]):]
     return new_series
 
+# NumPy implementations of the transformations above, which accept lists or arrays and return arrays.
+# Results agree with the list implementations to within rounding.
+
+def array_add_one(series, config):
+    return np.asarray(series,dtype=float) + 1
+
+def array_unit_normalization(series, config):
+    series = np.asarray(series,dtype=float)
+    reference_length = int(config["reference_length"])
+    SMALL_NUMBER = 0.00001
+    offset = int(config["baseline_offset"])
+    lower_idx = -(reference_length + offset)
+    upper_idx = -offset
+    total = series[lower_idx:upper_idx].sum()/float(reference_length)
+    if total == 0:
+        total = SMALL_NUMBER
+    return series/total
+
+def array_spike_normalization(series, config):
+    series = np.asarray(series,dtype=float)
+    alpha = float(config["alpha"])
+    prev_series = np.concatenate(([0.],series[:-1]))
+    return np.where(series == 0,0.,np.abs(series - prev_series)**alpha)
+
+def array_smoothing(series, config):
+    """ Moving average over up to "n_smooth" points, from cumulative sums """
+    series = np.asarray(series,dtype=float)
+    n_smooth = max(int(config["n_smooth"]),1)
+    cumulative_sums = np.concatenate(([0.],np.cumsum(series)))
+    upper_idx = np.arange(1,len(series) + 1)
+    lower_idx = np.maximum(upper_idx - n_smooth,0)
+    return (cumulative_sums[upper_idx] - cumulative_sums[lower_idx])/(upper_idx - lower_idx)
+
+def array_logarithmic_scaling(series, config):
+    series = np.asarray(series,dtype=float)
+    return np.log10(np.where(series <= 0,0.00001,series))
+
+VECTORIZED_TRANSFORMATIONS = {
+        add_one:array_add_one,
+        unit_normalization:array_unit_normalization,
+        spike_normalization:array_spike_normalization,
+        smoothing:array_smoothing,
+        logarithmic_scaling:array_logarithmic_scaling,
+        }
+
+def vectorize(transformations):
+    """ Replace transformations with their NumPy implementations, where they exist """
+    return [VECTORIZED_TRANSFORMATIONS.get(transformation,transformation) for transformation in transformations]
+
+def use_vectorized_transformations(config):
+    return config_flag(config,"vectorized_transformations")
+
+def as_list(series):
+    """ Return the values of a transformed series, which may be an array, as a list """
+    if isinstance(series,np.ndarray):
+        return series.tolist()
+    return series
+
 def save_library(library, file_name):
-    pickle.dump(library,open(file_name,"w"))
+    pickle.dump(library,open(file_name,"wb"))
 
 def load_library(file_name):
     try:
-        return pickle.load(open(file_name)) 
+        return pickle.load(open(file_name,"rb")) 
     except EOFError:
-        return Library()
+        return Library(config={})
+
+# Library used to transform reference series in each builder process
+builder_library = None
+
+def init_builder(config):
+    global builder_library
+    builder_library = Library(config=config)
+
+def transform_reference_series(chunk):
+    """ Transform a list of (is_trend, series) pairs with the builder process's Library """
+    transformed_chunk = []
+    for is_trend,series in chunk:
+        # as in Library.add_reference_series
+        builder_library.config["is_trend"] = is_trend
+        transformed_chunk.append((is_trend,as_list(builder_library.transform_input(series,is_test_series=False))))
+    return transformed_chunk
+
+def build_library(labelled_series, config, processes=None, chunk_size=100):
+    """
+    Build a Library from an iterable of (is_trend, series) pairs. 
+    Series are transformed in parallel by a pool of 'processes' processes, 
+    in chunks of 'chunk_size' series, and are added to the Library in input order.
+    """
+    import multiprocessing as mp
+    library = Library(config=config)
+    
+    def chunks():
+        chunk = []
+        for is_trend,series in labelled_series:
+            chunk.append((is_trend,series))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+    
+    pool = mp.Pool(processes,initializer=init_builder,initargs=(config,))
+    try:
+        for transformed_chunk in pool.imap(transform_reference_series,chunks()):
+            for is_trend,series in transformed_chunk:
+                if is_trend:
+                    library.trends.append(TopicSeries(series))
+                else:
+                    library.non_trends.append(TopicSeries(series))
+    finally:
+        pool.close()
+        pool.join()
+    return library
+
+# on-disk format of array libraries: a directory of NumPy arrays and a JSON header
+ARRAY_LIBRARY_FORMAT = "gnip_trend_detection.library"
+ARRAY_LIBRARY_VERSION = 1
+ARRAY_LIBRARY_HEADER = "library.json"
+
+def save_array_library(library, dir_name, series_length=None):
+    """
+    Save a Library as a directory of NumPy arrays, which can be memory-mapped by 'load_array_library'.
+    If 'series_length' is specified, all subseries of that length are saved too.
+    Transformation functions are saved by module and name.
+    """
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+    header = {"format":ARRAY_LIBRARY_FORMAT,
+            "version":ARRAY_LIBRARY_VERSION,
+            "config":library.config,
+            "transformations":[[f.__module__,f.__name__] for f in library.transformations],
+            "test_transformations":[[f.__module__,f.__name__] for f in library.test_transformations],
+            "series_length":series_length,
+            }
+    for is_trend,name in [(True,"trends"),(False,"non_trends")]:
+        matrix = library.get_reference_matrix(is_trend)
+        np.save(os.path.join(dir_name,name + ".npy"),matrix)
+        if series_length is not None:
+            n_windows = max(0,matrix.shape[1] - series_length + 1)
+            windows = np.zeros((len(matrix)*n_windows,series_length))
+            if n_windows > 0:
+                windows = np.lib.stride_tricks.sliding_window_view(matrix,series_length,axis=1).reshape(-1,series_length)
+            np.save(os.path.join(dir_name,name + "_windows.npy"),windows)
+    with open(os.path.join(dir_name,ARRAY_LIBRARY_HEADER),"w") as f:
+        json.dump(header,f,indent=2)
+
+def load_array_library(dir_name, mmap_mode="r"):
+    """
+    Load an ArrayLibrary saved by 'save_array_library'. By default, the arrays are memory-mapped read-only,
+    so that processes loading the same library share its pages.
+    """
+    with open(os.path.join(dir_name,ARRAY_LIBRARY_HEADER)) as f:
+        header = json.load(f)
+    if header.get("format") != ARRAY_LIBRARY_FORMAT:
+        raise ValueError("{} is not an array library".format(dir_name))
+    if header.get("version") != ARRAY_LIBRARY_VERSION:
+        raise ValueError("array library version {} is not supported (expected {})".format(header.get("version"),ARRAY_LIBRARY_VERSION))
+
+    def get_function(module_name, name):
+        return getattr(importlib.import_module(module_name),name)
+
+    def load(name):
+        return np.load(os.path.join(dir_name,name + ".npy"),mmap_mode=mmap_mode)
+
+    windows = None
+    if header["series_length"] is not None:
+        windows = {True:load("trends_windows"),False:load("non_trends_windows")}
+    return ArrayLibrary(load("trends"),load("non_trends"),header["config"],
+            [get_function(*f) for f in header["transformations"]],
+            [get_function(*f) for f in header["test_transformations"]],
+            windows = windows,
+            series_length = header["series_length"]
+            )
 
 def merge_library(library, file_name): 
     """
@@ -35,25 +35,21 @@ def mk_test(x, alpha = 0.05):
       >>> trend,h,p,z = mk_test(x,0.05) 
 
     """
+    x = np.asarray(x)
     n = len(x)
     
-    # calculate S 
-    s = 0
-    for k in range(n-1):
-        for j in range(k+1,n):
-            s += np.sign(x[j] - x[k])
-    
     # calculate the unique data
-    unique_x = np.unique(x)
+    unique_x, ranks, tp = np.unique(x,return_inverse=True,return_counts=True)
     g = len(unique_x)
     
+    # calculate S 
+    s = mk_s(ranks.reshape(-1))
+    
     # calculate the var(s)
     if n == g: # there is no tie
         var_s = (n*(n-1)*(2*n+5))/18
     else: # there are some ties in data
-        tp = np.zeros(unique_x.shape)
-        for i in range(len(unique_x)):
-            tp[i] = sum(x == unique_x[i])
+        tp = tp.astype(float)
         var_s = (n*(n-1)*(2*n+5) - np.sum(tp*(tp-1)*(2*tp+5)))/18
     
     if s>0:
@@ -76,3 +72,58 @@ def mk_test(x, alpha = 0.05):
         
     return trend, h, p, z
     
+
+
+def mk_s(x, broadcast_size = 1000):
+    """
+    Calculate the MK statistic S, the sum of sign(x[j] - x[k]) over all pairs k < j.
+    Series of up to 'broadcast_size' points are handled by comparing all pairs at once. 
+    Longer series are handled by a bottom-up merge sort (Knight's algorithm), in O(n log^2 n):
+    at each level, the points in each right-hand run are compared with the sorted points 
+    of the left-hand run that precedes it.
+    """
+    x = np.asarray(x)
+    n = len(x)
+    if n <= broadcast_size:
+        return int(np.triu(np.sign(x[np.newaxis,:] - x[:,np.newaxis]),1).sum())
+
+    # work with integer ranks, so that (run pair, rank) can be combined into one sort key
+    unique_x, ranks = np.unique(x,return_inverse=True)
+    g = len(unique_x)
+    ranks = ranks.reshape(-1).astype(np.int64)
+    idx = np.arange(n)
+    s = 0
+    width = 1
+    while width < n:
+        run = idx//width
+        pair = run//2
+        is_left = run % 2 == 0
+        left_keys = np.sort(pair[is_left]*g + ranks[is_left])
+        right_pair = pair[~is_left]
+        right_keys = right_pair*g + ranks[~is_left]
+        # positions of each right-hand point's run pair in the sorted left-hand keys
+        pair_begin = np.searchsorted(left_keys,right_pair*g,'left')
+        pair_end = np.searchsorted(left_keys,(right_pair + 1)*g,'left')
+        n_less = np.searchsorted(left_keys,right_keys,'left') - pair_begin
+        n_greater = pair_end - np.searchsorted(left_keys,right_keys,'right')
+        s += int(n_less.sum()) - int(n_greater.sum())
+        width *= 2
+    return s
+
+def mk_tie_term(tp):
+    """ Contribution of a group of 'tp' tied values to the variance of S (times 18) """
+    return tp*(tp-1)*(2*tp+5)
+
+def mk_z(s, n, tie_sum):
+    """
+    Vectorized calculation of the normalized test statistic, as returned by mk_test, from 
+    arrays of S, the number of data points, and the sum of 'mk_tie_term' over all groups of tied values.
+    """
+    s = np.asarray(s,dtype=float)
+    n = np.asarray(n,dtype=float)
+    var_s = (n*(n-1)*(2*n+5) - np.asarray(tie_sum,dtype=float))/18
+    z = np.zeros(len(s))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        z = np.where(s > 0,(s - 1)/np.sqrt(var_s),z)
+        z = np.where(s < 0,(s + 1)/np.sqrt(var_s),z)
+    return z
@@ -1,5 +1,7 @@
 import collections
 import datetime
+import operator
+import os
 import sys
 import pickle
 import math
@@ -9,8 +11,11 @@ from dateutil.parser import parse
 import numpy as np
 import scipy.stats.distributions as dists
 from sklearn.linear_model import LinearRegression
+from sklearn.neighbors import BallTree
 
-from .mk_test import mk_test
+from .mk_test import mk_test, mk_z, mk_tie_term
+from .ring_buffer import RingBuffer
+from .utils import config_flag
 
 """
 Classes in the module implement trend detection techniques.
@@ -20,68 +25,258 @@ For uniform interface, all classes must implement the following functions:
     update(kwargs): updates the model with new information;
         required keyword arguments may differ between models
 
+Classes may also implement a batch interface:
+    update_many(kwargs): updates the model with a sequence of points; 
+        takes keyword arguments "counts" and "interval_start_times"
+    get_results(): returns an array of the figures of merit for each point 
+        in the most recent call to update_many. These must match the results
+        of calling update and get_result for each point in turn.
+
+and a cross-counter interface:
+    update_counters(models, kwargs): class method that updates many instances, one per counter,
+        with their latest points; takes keyword arguments "counts" and "interval_start_times",
+        with one item per instance. Results must match those of calling update for each instance.
+
+Multi-counter versions of some models, listed in 'multi_counter_models', hold the state
+of many counters in arrays, and advance them all by one time step in each update.
+
+Models keep only as much count history as their windows require. 
+Set "keep_history" to true in a model config to keep the full history.
+
+For checkpoints, models list the attributes that hold their state in 'state_attributes'.
 """
 
+def history_buffer(config, capacity):
+    """ 
+    Return a RingBuffer that holds the last 'capacity' counts,
+    or all counts if 'capacity' is None or 'keep_history' is set in the config.
+    """
+    if config_flag(config,'keep_history'):
+        capacity = None
+    return RingBuffer(capacity)
+
 class MannKendall:
+    # attributes saved in checkpoints
+    state_attributes = ["counts","s","tie_sum","value_counts"]
+
     def __init__(self, config):
-        self.counts = []
         try:
             self.window_size = int(config['window_size'])
         except KeyError:
             self.window_size = None
+        self.counts = history_buffer(config,self.window_size)
         try:
             self.alpha = float(config['alpha'])
         except KeyError:
             self.alpha = 0.05
+        self.incremental = config_flag(config,'incremental')
+
+        # running statistics for incremental mode: S, the tie correction 
+        # (sum of 'mk_tie_term' over groups of tied values), and the counts of each value in the window
+        self.s = 0
+        self.tie_sum = 0
+        self.value_counts = collections.Counter()
 
     def update(self, **kwargs):
         count = kwargs["count"]
+        if self.incremental:
+            self.update_running_stats(float(count))
         self.counts.append( count )
 
+    def update_running_stats(self, value):
+        """ Add a value to the window statistics, removing the oldest value if the window is full """
+        window = self.counts.values()
+        if self.window_size is not None:
+            window = self.counts.tail(self.window_size)
+            if len(window) == self.window_size:
+                old_value = float(window[0])
+                window = window[1:]
+                self.s -= np.sign(window - old_value).sum()
+                self.remove_value(old_value)
+        self.s += np.sign(value - window).sum()
+        ct = self.value_counts[value]
+        self.tie_sum += mk_tie_term(ct + 1) - mk_tie_term(ct)
+        self.value_counts[value] = ct + 1
+
+    def remove_value(self, value):
+        ct = self.value_counts[value]
+        self.tie_sum += mk_tie_term(ct - 1) - mk_tie_term(ct)
+        if ct == 1:
+            del self.value_counts[value]
+        else:
+            self.value_counts[value] = ct - 1
+
     def get_result(self):
-        x = self.counts
+        if self.incremental:
+            n = len(self.counts)
+            if self.window_size is not None:
+                n = min(n,self.window_size)
+            return mk_z([self.s],[n],[self.tie_sum])[0]
+        x = self.counts.values()
         if self.window_size is not None:
-            x = self.counts[-self.window_size:]
+            x = self.counts.tail(self.window_size)
         return mk_test(x,self.alpha)[3]
 
+    def update_many(self, **kwargs):
+        """
+        Update with a sequence of counts, and calculate the MK statistic
+        for each point. S is built up from the pairs that each point adds to 
+        the window and the pairs that leave the window with its oldest point.
+        """
+        counts = [float(ct) for ct in kwargs["counts"]]
+        if len(counts) == 0:
+            self.results = np.zeros(0)
+            return
+        
+        # only the last (window_size - 1) previous points share a window with the new points
+        n_prev = len(self.counts)
+        if self.window_size is not None:
+            n_prev = min(n_prev,self.window_size - 1)
+        x = np.concatenate((self.counts.tail(n_prev),counts))
+        self.counts.extend(counts)
+        window_size = self.window_size if self.window_size is not None else len(x)
+        
+        # each row of 'windows' holds x[t-window_size:t+1], padded with NaN for t < window_size 
+        padded = np.concatenate((np.full(window_size,np.nan),x))
+        windows = np.lib.stride_tricks.sliding_window_view(padded,window_size + 1)
+        delta_s = np.zeros(len(x))
+        block_size = max(1,10000000//(window_size + 1))
+        for lower in range(0,len(x),block_size):
+            block = windows[lower:lower+block_size]
+            with np.errstate(invalid='ignore'):
+                added = np.nansum(np.sign(block[:,-1:] - block[:,1:-1]),axis=1)
+                removed = np.nansum(np.sign(block[:,1:-1] - block[:,:1]),axis=1)
+            delta_s[lower:lower+block_size] = added - removed
+        s = np.cumsum(delta_s)
+        
+        # running tie correction, over the values in each window
+        tie_sum = np.zeros(len(x))
+        self.tie_sum = 0
+        self.value_counts = collections.Counter()
+        values = x.tolist()
+        for t,value in enumerate(values):
+            if t >= window_size:
+                self.remove_value(values[t - window_size])
+            ct = self.value_counts[value]
+            self.tie_sum += mk_tie_term(ct + 1) - mk_tie_term(ct)
+            self.value_counts[value] = ct + 1
+            tie_sum[t] = self.tie_sum
+        self.s = s[-1]
+
+        n = np.minimum(np.arange(1,len(x) + 1),window_size)
+        self.results = mk_z(s[n_prev:],n[n_prev:],tie_sum[n_prev:])
+
+    def get_results(self):
+        return self.results
+
+def sequential_sum(values):
+    """ Sum the rows of an array in order, as Python's 'sum' adds the items of a list """
+    if values.ndim == 1:
+        return float(sum(values.tolist()))
+    total = np.zeros(values.shape[1:])
+    for row in values:
+        total += row
+    return total
+
+def set_regression_parameters(model, config):
+    """ Set the linear regression parameters in 'config' as attributes of 'model' """
+    model.min_points = int(config['min_points'])
+    try:
+        model.averaging_window_size = int(config["averaging_window_size"]) 
+    except KeyError:
+        model.averaging_window_size = 1
+    model.norm_by_mean = config_flag(config,'norm_by_mean')
+    try:
+        model.regression_window_size = int(config['regression_window_size']) 
+    except KeyError:
+        model.regression_window_size = None
+
+def regression_running_sums(model):
+    """ 
+    Return the running sums of a linear regression model (the sum of the counts in the averaging window,
+    and the sums of y and x*y in the regression window), calculated from its stored counts 
+    """
+    counts_sum = sequential_sum(model.counts.tail(model.averaging_window_size))
+    y = model.averaged_counts.values()
+    if model.regression_window_size is not None:
+        y = model.averaged_counts.tail(model.regression_window_size)
+    x = np.arange(len(y)).reshape((-1,) + (1,)*(y.ndim - 1))
+    return counts_sum, sequential_sum(y), sequential_sum(x*y)
+
 class LinearRegressionModel(object):
+    # attributes saved in checkpoints
+    state_attributes = ["n_points","counts","averaged_counts","counts_sum","sum_y","sum_xy","n_since_reset"]
+
     def __init__(self, config):
-        self.counts = [] 
-        self.averaged_counts = []
-        self.min_points = int(config['min_points'])
-        try:
-            self.averaging_window_size = int(config["averaging_window_size"]) 
-        except KeyError:
-            self.averaging_window_size = 1
-        try:
-            self.norm_by_mean = bool(config['norm_by_mean'])
-        except KeyError:
-            self.norm_by_mean = False
-        try:
-            self.regression_window_size = int(config['regression_window_size']) 
-        except KeyError:
-            self.regression_window_size = None
+        self.n_points = 0
+        set_regression_parameters(self,config)
+        self.incremental = config_flag(config,'incremental')
         self.regression = LinearRegression()
 
+        # one extra point is kept, to be dropped from the running sums
+        self.counts = history_buffer(config,self.averaging_window_size + 1) 
+        regression_capacity = None
+        if self.regression_window_size is not None:
+            regression_capacity = self.regression_window_size + 1
+        self.averaged_counts = history_buffer(config,regression_capacity)
+        
+        # running sums for incremental mode, 
+        # with x = 0,1,...,m-1 for the m averaged counts in the regression window
+        self.RESET_INTERVAL = 1000
+        self.reset_running_sums()
+
+    def reset_running_sums(self):
+        """ Recalculate the running sums from the stored counts, to remove accumulated rounding error """
+        self.counts_sum,self.sum_y,self.sum_xy = regression_running_sums(self)
+        self.n_since_reset = 0
+
     def update(self, **kwargs):
         count = kwargs["count"]
         self.counts.append( count )
+        self.n_points += 1
         
         size = self.averaging_window_size
-        if len(self.counts) >= size:
-            self.averaged_counts.append( sum(self.counts[-size:])/float(size) ) 
+        if self.incremental:
+            self.counts_sum += count
+            if self.n_points > size:
+                self.counts_sum -= self.counts[-size-1]
+            averaged_count = self.counts_sum/float(size) if self.n_points >= size else 0
+            self.averaged_counts.append(averaged_count)
+            self.update_running_sums(averaged_count)
+            return
+
+        if self.n_points >= size:
+            self.averaged_counts.append( sum(self.counts.tail(size).tolist())/float(size) ) 
         else:
             self.averaged_counts.append(0)
 
+    def update_running_sums(self, y_new):
+        """ Add the latest averaged count to the regression window, and drop the oldest if the window is full """
+        m = len(self.averaged_counts) - 1
+        if self.regression_window_size is not None and m >= self.regression_window_size:
+            # shift x down by one for the remaining points
+            y_old = self.averaged_counts[-self.regression_window_size-1]
+            m = self.regression_window_size - 1
+            self.sum_y -= y_old
+            self.sum_xy -= self.sum_y
+        self.sum_xy += m*y_new
+        self.sum_y += y_new
+
+        self.n_since_reset += 1
+        if self.n_since_reset >= self.RESET_INTERVAL:
+            self.reset_running_sums()
+
     def get_result(self):
         """ Run a linear fit on the averaged count,
         which will be the raw counts if not otherwise specified. """
-        if len(self.averaged_counts) < self.min_points:
+        if self.n_points < self.min_points:
             return 0
+        if self.incremental:
+            return self.get_incremental_result()
         if self.regression_window_size is not None:
-            y = np.array(self.averaged_counts[-self.regression_window_size:])  
+            y = np.array(self.averaged_counts.tail(self.regression_window_size))  
         else:
-            y = np.array(self.averaged_counts)  
+            y = np.array(self.averaged_counts.values())  
         if self.norm_by_mean: 
             y = y/np.mean(y)
         x = range(len(y))
@@ -89,7 +284,74 @@ class LinearRegressionModel(object):
         slope = self.regression.fit(X,y).coef_[0]
         return slope
 
+    def get_incremental_result(self):
+        """ Least-squares slope from the running sums """
+        m = len(self.averaged_counts)
+        if self.regression_window_size is not None:
+            m = min(m,self.regression_window_size)
+        if m < 2:
+            return 0
+        sum_x = m*(m-1)/2.
+        sum_xx = (m-1)*m*(2*m-1)/6.
+        slope = (m*self.sum_xy - sum_x*self.sum_y)/(m*sum_xx - sum_x*sum_x)
+        if self.norm_by_mean:
+            slope = slope*m/self.sum_y
+        return slope
+
+    def update_many(self, **kwargs):
+        """
+        Update with a sequence of counts, and calculate the regression slope for each point,
+        using cumulative sums over the counts and averaged counts.
+        """
+        counts = np.array(kwargs["counts"],dtype=float)
+        n_prev = self.n_points
+        self.n_points += len(counts)
+        
+        # moving averages, over the new counts and the previous counts that share their windows;
+        # 'point_idx' indexes the new points in the concatenated array
+        size = self.averaging_window_size
+        x = np.concatenate((self.counts.tail(size - 1),counts))
+        point_idx = np.arange(len(x) - len(counts),len(x))
+        cumulative_counts = np.concatenate(([0.],np.cumsum(x)))
+        averaged_counts = (cumulative_counts[point_idx + 1] - cumulative_counts[np.maximum(point_idx + 1 - size,0)])/float(size)
+        averaged_counts[n_prev + np.arange(1,len(counts) + 1) < size] = 0
+        self.counts.extend(counts)
+
+        # least-squares slope in each regression window, with x = 0,1,...,m-1 
+        y = self.averaged_counts.values()
+        if self.regression_window_size is not None:
+            y = self.averaged_counts.tail(self.regression_window_size - 1)
+        y = np.concatenate((y,averaged_counts))
+        self.averaged_counts.extend(averaged_counts)
+        point_idx = np.arange(len(y) - len(counts),len(y))
+        cumulative_y = np.concatenate(([0.],np.cumsum(y)))
+        cumulative_xy = np.concatenate(([0.],np.cumsum(np.arange(len(y))*y)))
+        upper = point_idx + 1
+        lower = np.zeros(len(point_idx),dtype=np.int64)
+        if self.regression_window_size is not None:
+            lower = np.maximum(upper - self.regression_window_size,0)
+        m = (upper - lower).astype(float)
+        sum_y = cumulative_y[upper] - cumulative_y[lower]
+        sum_xy = cumulative_xy[upper] - cumulative_xy[lower] - lower*sum_y
+        sum_x = m*(m-1)/2
+        sum_xx = (m-1)*m*(2*m-1)/6
+        with np.errstate(divide='ignore',invalid='ignore'):
+            slopes = (m*sum_xy - sum_x*sum_y)/(m*sum_xx - sum_x*sum_x)
+            if self.norm_by_mean:
+                slopes = slopes*m/sum_y
+        slopes[m < 2] = 0
+        slopes[n_prev + np.arange(1,len(counts) + 1) < self.min_points] = 0
+        self.results = slopes
+        if self.incremental:
+            self.reset_running_sums()
+
+    def get_results(self):
+        return self.results
+
 class WeightedDataTemplates(object):
+    # attributes saved in checkpoints; the library is not saved
+    state_attributes = ["total_series","total_sum","trend_weight","non_trend_weight","test_transform"]
+
     def __init__(self, config): 
         """
         This class implements the data-template-based trend detection technique
@@ -100,7 +362,7 @@ class WeightedDataTemplates(object):
         
         # set up basic member variables
         self.current_count = None
-        self.total_series = []
+        self.total_sum = 0
         self.trend_weight = None
         self.non_trend_weight = None
 
@@ -120,6 +382,9 @@ class WeightedDataTemplates(object):
         else:
             self.reference_length = 210
 
+        # only the latest "reference_length" points are transformed 
+        self.total_series = history_buffer(config,self.reference_length)
+
         if "lambda" in config:
             self.Lambda = float(config["lambda"])
         else:
@@ -133,10 +398,19 @@ class WeightedDataTemplates(object):
 
         from .library import Library
         if "library_file_name" in config:
-            self.library = pickle.load(open(config["library_file_name"],'rb'))
+            self.library = get_library(config["library_file_name"])
         else:
             self.library = library.Library(config={})
 
+        # all "series_length"-sized subseries of the reference series
+        self.trend_windows, self.non_trend_windows = get_reference_windows(self.library,self.series_length)
+
+        # with "incremental" set, the test transformation state is carried between updates, 
+        # if the library's test transformations allow it; results agree to within rounding
+        self.test_transform = None
+        if config_flag(config,'incremental'):
+            self.test_transform = self.library.get_incremental_test_transform(config,self.series_length)
+
         self.config = config
 
     def update(self, **kwargs):
@@ -152,33 +426,99 @@ class WeightedDataTemplates(object):
             check_for_self = kwargs["check_for_self"]
            
         # add current data point to series 
-        self.total_series.append(current_count)
+        self.append(current_count)
 
         # don't return anything meaningful until total_series is long enough
-        if len(self.total_series) < self.reference_length or sum(self.total_series) == 0: 
+        if len(self.total_series) < self.reference_length or self.total_sum == 0: 
             self.trend_weight = float(0)
             self.non_trend_weight = float(0)
             return
 
-        # transform a "reference_length"-sized sub-series
-        #transformed_series = self.total_series[-self.reference_length:]
-        #for transformation in self.library.test_transformations:
-        #    transformed_series = transformation(transformed_series,self.config) 
-        transformed_series = self.library.transform_input(self.total_series[-self.reference_length:],is_test_series=True,config=self.config)
-        # get correctly-sized test series
-        test_series =  transformed_series[-self.series_length:]
-
-        self.trend_weight = float(0)
-        for reference_series in self.library.trends:  
-            weight = self.weight(reference_series,test_series,check_for_self) 
-            #self.logger.debug("trend wt: {}".format(weight))
-            self.trend_weight += weight
+        # reference series must be matched exactly, so don't use the incremental transformation
+        test_series = np.array([self.get_test_series(incremental=not check_for_self)])
+
+        self.trend_weight = float(self.total_weights(self.trend_windows,test_series,check_for_self)[0])
+        self.non_trend_weight = float(self.total_weights(self.non_trend_windows,test_series,check_for_self)[0])
+
+    def update_many(self, **kwargs):
+        """
+        Calculate trend weights for each point in a sequence of counts.
+        The test series for all points are compared to each reference series at once.
+        """
+        counts = list(kwargs["counts"])
         
-        self.non_trend_weight = float(0)
-        for reference_series in self.library.non_trends: 
-            weight = self.weight(reference_series,test_series,check_for_self)
-            #self.logger.debug("non trend wt: {}".format(weight))
-            self.non_trend_weight += weight
+        # build a matrix of test series, for points with enough data
+        test_idx = []
+        test_series = []
+        for i,count in enumerate(counts):
+            self.append(count)
+            if len(self.total_series) < self.reference_length or self.total_sum == 0: 
+                continue
+            test_idx.append(i)
+            test_series.append(self.get_test_series())
+        test_series = np.array(test_series,dtype=float).reshape(len(test_idx),min(self.series_length,self.reference_length))
+
+        trend_weights = np.zeros(len(counts))
+        non_trend_weights = np.zeros(len(counts))
+        trend_weights[test_idx] = self.total_weights(self.trend_windows,test_series)
+        non_trend_weights[test_idx] = self.total_weights(self.non_trend_windows,test_series)
+
+        if len(counts) > 0:
+            self.trend_weight = float(trend_weights[-1])
+            self.non_trend_weight = float(non_trend_weights[-1])
+        non_trend_weights[non_trend_weights == 0] = self.SMALL_NUMBER
+        self.results = trend_weights/non_trend_weights
+
+    @classmethod
+    def update_counters(cls, models, **kwargs):
+        """
+        Update many instances, one per counter, with their latest counts, as 'update' does.
+        The test series of all the counters that share a library and scoring parameters
+        are compared to each reference series at once.
+        """
+        counts = kwargs["counts"]
+
+        groups = collections.OrderedDict()
+        for model,count in zip(models,counts):
+            model.append(count)
+            if len(model.total_series) < model.reference_length or model.total_sum == 0:
+                model.trend_weight = float(0)
+                model.non_trend_weight = float(0)
+                continue
+            groups.setdefault(model.get_scoring_key(),[]).append(model)
+
+        for group in groups.values():
+            scorer = group[0]
+            test_series = np.array([model.get_test_series() for model in group],dtype=float)
+            trend_weights = scorer.total_weights(scorer.trend_windows,test_series)
+            non_trend_weights = scorer.total_weights(scorer.non_trend_windows,test_series)
+            for model,trend_weight,non_trend_weight in zip(group,trend_weights,non_trend_weights):
+                model.trend_weight = float(trend_weight)
+                model.non_trend_weight = float(non_trend_weight)
+
+    def get_scoring_key(self):
+        """ Instances with equal keys score test series in the same way """
+        return (id(self.trend_windows),id(self.non_trend_windows),self.reference_length,self.Lambda,
+                self.distance_measure_name,self.pruning,self.approximate,self.n_neighbors,self.n_segments)
+
+    def get_results(self):
+        return self.results
+
+    def append(self, count):
+        """ Add a count to the series """
+        self.total_series.append(count)
+        self.total_sum += count
+        if self.test_transform is not None:
+            self.test_transform.append(count)
+
+    def get_test_series(self, incremental=True):
+        """ Return the transformed test series for the latest "reference_length" points """
+        if incremental and self.test_transform is not None:
+            test_series = self.test_transform.get_test_series()
+            if test_series is not None:
+                return test_series
+        transformed_series = self.library.transform_input(self.total_series.tail(self.reference_length).tolist(),is_test_series=True,config=self.config)
+        return transformed_series[-self.series_length:]
 
     def get_result(self):
         """
@@ -212,6 +552,24 @@ class WeightedDataTemplates(object):
         #self.logger.debug("min d: {}".format(min_distance))
         return math.exp(-float(min_distance) * self.Lambda )
 
+    def total_weights(self, reference_windows, test_series, check_for_self=False):
+        """
+        Vectorized version of 'weight', for a matrix of test series (one per row),
+        summed over all the reference series in 'reference_windows'.
+        Return an array of total weights.
+        """
+        if self.approximate:
+            min_distances = reference_windows.approximate_min_distances(test_series,self.n_segments,self.n_neighbors)
+        elif self.pruning:
+            min_distances = reference_windows.pruned_min_distances(test_series,self.n_segments)
+        else:
+            distance_matrix = getattr(self.distance_measures,self.distance_measure_name + "_matrix")
+            min_distances = reference_windows.min_distances(test_series,distance_matrix)
+        weights = np.exp(-min_distances * self.Lambda)
+        if check_for_self:
+            weights[reference_windows.is_reference(test_series)] = 0
+        return weights.sum(axis=1)
+
     def set_up_distance_measures(self, config): 
         """
         Instantiate helper class for distance measures.
@@ -223,6 +581,16 @@ class WeightedDataTemplates(object):
 
         self.distance_measures = DistanceMeasures()
 
+        # skip subseries that can't be the closest match
+        self.pruning = config_flag(config,"pruning")
+        # or compare only the "n_neighbors" subseries closest to the test series in segment sums
+        self.approximate = config_flag(config,"approximate")
+        self.n_neighbors = int(config.get("n_neighbors",50))
+        self.n_segments = int(config.get("n_segments",10))
+        # segment sums only bound the 'euclidean' measure
+        if (self.pruning or self.approximate) and self.distance_measure_name != "euclidean":
+            raise ValueError("pruning and approximate search are only supported for the 'euclidean' distance measure")
+
 class DistanceMeasures(object):
     """
     Helper class for distance measures.
@@ -234,6 +602,316 @@ class DistanceMeasures(object):
         for ai,bi in zip(a,b):
             sum += abs(ai - bi)
         return sum
+    def euclidean_matrix(self,a,b):
+        """ Distances between every row of 'a' and every row of 'b' """
+        return np.abs(a[:,np.newaxis,:] - b[np.newaxis,:,:]).sum(axis=2)
+
+class ReferenceWindows(object):
+    """
+    Helper class that holds every "series_length"-sized subseries 
+    of a set of reference series, as the rows of a 2-D array.
+    Precomputed subseries, in that form, may be passed in as 'windows'.
+    """
+    # maximum number of elements in intermediate (test series x subseries x series length) arrays,
+    # which are faster to compute while they fit in cache
+    BLOCK_SIZE = 2**16
+
+    def __init__(self, reference_matrix, series_length, windows = None):
+        self.references = reference_matrix
+        self.series_length = series_length
+        n_references, length = reference_matrix.shape
+        self.n_windows = max(0,length - series_length + 1)
+        if windows is None:
+            if self.n_windows > 0:
+                windows = np.lib.stride_tricks.sliding_window_view(reference_matrix,series_length,axis=1)
+            else:
+                windows = np.zeros((n_references,0,series_length))
+            windows = windows.reshape(n_references*self.n_windows,series_length)
+        elif windows.shape != (n_references*self.n_windows,series_length):
+            raise ValueError("precomputed subseries don't match the reference series")
+        self.windows = windows
+        # subseries that run past the end of a shorter reference series are never matched
+        lengths = (~np.isnan(reference_matrix)).sum(axis=1)
+        self.valid = np.arange(self.n_windows)[np.newaxis,:] + series_length <= lengths[:,np.newaxis]
+        # BallTree indexes of the segment sums of valid subseries, keyed by the number of segments
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.references)
+
+    def min_distances(self, test_series, distance_matrix):
+        """
+        Return the (test series x reference series) array of minimum distances between 
+        each test series and the subseries of each reference series.
+        """
+        min_distances = np.full((len(test_series),len(self)),np.inf)
+        if len(test_series) == 0 or self.n_windows == 0:
+            return min_distances
+        # compare blocks of test series to blocks of subseries
+        block_size = max(1,self.BLOCK_SIZE//(len(self.windows)*self.series_length))
+        window_block_size = max(1,self.BLOCK_SIZE//(block_size*self.series_length))
+        for lower in range(0,len(test_series),block_size):
+            tests = test_series[lower:lower+block_size]
+            distances = np.empty((len(tests),len(self.windows)))
+            for window_lower in range(0,len(self.windows),window_block_size):
+                window_upper = window_lower + window_block_size
+                distances[:,window_lower:window_upper] = distance_matrix(tests,self.windows[window_lower:window_upper])
+            distances = distances.reshape(-1,len(self),self.n_windows)
+            distances[:,~self.valid] = np.inf
+            min_distances[lower:lower+block_size] = distances.min(axis=2)
+        return min_distances
+
+    def pruned_min_distances(self, test_series, n_segments):
+        """
+        Return the same minimum distances as 'min_distances' for the 'euclidean' (L1) distance, 
+        without comparing every subseries in full.
+
+        The L1 distance between two series is at least the L1 distance between their
+        sums over each of 'n_segments' segments. For each test series and reference series, 
+        the subseries with the smallest lower bound is compared first, and other subseries
+        are only compared if their lower bound is less than that distance.
+        """
+        min_distances = np.full((len(test_series),len(self)),np.inf)
+        if len(test_series) == 0 or self.n_windows == 0:
+            return min_distances
+        segment_starts = self.get_segment_starts(n_segments)
+        # (segment x subseries) array of sums
+        window_sums = np.add.reduceat(self.windows,segment_starts,axis=1).T.copy()
+        invalid = ~self.valid.reshape(-1)
+        # allow for rounding error in the lower bounds
+        SLACK = 1 + 1e-9
+        
+        block_size = max(1,self.BLOCK_SIZE//len(self.windows))
+        for lower in range(0,len(test_series),block_size):
+            tests = test_series[lower:lower+block_size]
+            test_sums = np.add.reduceat(tests,segment_starts,axis=1)
+            bounds = np.zeros((len(tests),len(self.windows)))
+            for segment in range(len(segment_starts)):
+                bounds += np.abs(test_sums[:,segment,np.newaxis] - window_sums[np.newaxis,segment,:])
+            bounds[:,invalid] = np.inf
+            bounds = bounds.reshape(len(tests),len(self),self.n_windows)
+
+            # distances to the likely best matches
+            best = bounds.argmin(axis=2)
+            rows = np.arange(len(self))*self.n_windows + best
+            distances = np.empty((len(tests),len(self)))
+            best_block_size = max(1,self.BLOCK_SIZE//(len(self)*self.series_length))
+            for best_lower in range(0,len(tests),best_block_size):
+                best_idx = slice(best_lower,best_lower+best_block_size)
+                distances[best_idx] = np.abs(tests[best_idx,np.newaxis,:] - self.windows[rows[best_idx]]).sum(axis=2)
+            distances[np.isinf(bounds.min(axis=2))] = np.inf
+
+            # distances to the remaining subseries that might be closer
+            candidates = bounds < distances[:,:,np.newaxis]*SLACK
+            np.put_along_axis(candidates,best[:,:,np.newaxis],False,axis=2)
+            test_idx, reference_idx, window_idx = np.nonzero(candidates)
+            chunk_size = max(1,self.BLOCK_SIZE//self.series_length)
+            for chunk in range(0,len(test_idx),chunk_size):
+                idx = slice(chunk,chunk+chunk_size)
+                candidate_distances = np.abs(tests[test_idx[idx]] 
+                        - self.windows[reference_idx[idx]*self.n_windows + window_idx[idx]]).sum(axis=1)
+                np.minimum.at(distances,(test_idx[idx],reference_idx[idx]),candidate_distances)
+            min_distances[lower:lower+block_size] = distances
+        return min_distances
+
+    def get_segment_starts(self, n_segments):
+        return np.unique(np.arange(n_segments)*self.series_length//n_segments)
+
+    def get_index(self, n_segments):
+        """ Return a BallTree of the segment sums of the valid subseries, and their row numbers """
+        if n_segments not in self.indexes:
+            rows = np.flatnonzero(self.valid.reshape(-1))
+            window_sums = np.add.reduceat(self.windows[rows],self.get_segment_starts(n_segments),axis=1)
+            self.indexes[n_segments] = (BallTree(window_sums,metric="manhattan"),rows)
+        return self.indexes[n_segments]
+
+    def approximate_min_distances(self, test_series, n_segments, n_neighbors):
+        """
+        Return approximations of the minimum distances from 'min_distances' for the 
+        'euclidean' (L1) distance. Only the 'n_neighbors' subseries closest to each test series 
+        in (L1 distance between) sums over 'n_segments' segments are compared in full. 
+        The minimum distance to a reference series with none of these subseries is infinite.
+        Larger values of 'n_neighbors' give better approximations.
+        """
+        min_distances = np.full((len(test_series),len(self)),np.inf)
+        if len(test_series) == 0 or not self.valid.any():
+            return min_distances
+        index, rows = self.get_index(n_segments)
+        test_sums = np.add.reduceat(test_series,self.get_segment_starts(n_segments),axis=1)
+        neighbors = rows[index.query(test_sums,k=min(n_neighbors,len(rows)),return_distance=False)]
+        
+        block_size = max(1,self.BLOCK_SIZE//(neighbors.shape[1]*self.series_length))
+        for lower in range(0,len(test_series),block_size):
+            block_neighbors = neighbors[lower:lower+block_size]
+            distances = np.abs(test_series[lower:lower+block_size,np.newaxis,:] - self.windows[block_neighbors]).sum(axis=2)
+            test_idx = np.repeat(np.arange(lower,lower+len(block_neighbors)),block_neighbors.shape[1])
+            np.minimum.at(min_distances,(test_idx,block_neighbors.reshape(-1)//self.n_windows),distances.reshape(-1))
+        return min_distances
+
+    def is_reference(self, test_series):
+        """ Return a (test series x reference series) array that is True where they are equal """
+        length = test_series.shape[1]
+        if length > self.references.shape[1]:
+            return np.zeros((len(test_series),len(self)),dtype=bool)
+        same_length = np.isnan(self.references[:,length:]).all(axis=1)
+        if length > 0:
+            same_length &= ~np.isnan(self.references[:,length-1])
+        return same_length & (test_series[:,np.newaxis,:] == self.references[np.newaxis,:,:length]).all(axis=2)
+
+# Library instances, keyed by file name, and their (trend, non-trend) ReferenceWindows, 
+# keyed by (library id, series length). These are read-only, so they are shared 
+# between WeightedDataTemplates instances in a process.
+libraries = {}
+reference_windows = {}
+
+def get_library(file_name):
+    """ Return the process-wide Library loaded from 'file_name' """
+    if file_name not in libraries:
+        from .library import load_array_library
+        if os.path.isdir(file_name):
+            # array library directory, written by 'save_array_library'
+            libraries[file_name] = load_array_library(file_name)
+        else:
+            libraries[file_name] = pickle.load(open(file_name,'rb'))
+    return libraries[file_name]
+
+def get_reference_windows(library, series_length):
+    """ Return the process-wide trend and non-trend ReferenceWindows for 'library' """
+    key = (id(library),series_length)
+    if key not in reference_windows:
+        # keep a reference to the library, so that its id isn't reused
+        reference_windows[key] = (library,
+                ReferenceWindows(library.get_reference_matrix(is_trend=True),series_length,
+                    library.get_reference_windows(True,series_length)),
+                ReferenceWindows(library.get_reference_matrix(is_trend=False),series_length,
+                    library.get_reference_windows(False,series_length))
+                )
+    return reference_windows[key][1:]
+
+class PoissonIntervalCache(object):
+    """
+    Helper class that caches the sizes of Poisson confidence intervals,
+    for a single value of alpha. Sizes for integer means up to 'table_size' are kept
+    in a table that is filled as means are seen. Sizes for other means are kept
+    in a bounded LRU cache.
+    Use 'get_poisson_interval_cache' to share instances within a process.
+    """
+    def __init__(self, alpha, table_size = 100000, lru_size = 10000):
+        self.alpha = alpha
+        self.table = np.full(table_size + 1,np.nan)
+        self.lru_size = lru_size
+        self.lru = collections.OrderedDict()
+
+    def compute(self, means):
+        lower, upper = dists.poisson.interval(self.alpha,means)
+        return upper - lower
+
+    def get(self, mean):
+        """ Return the confidence interval size for a single mean """
+        mean = float(mean)
+        if mean.is_integer() and 0 < mean < len(self.table):
+            size = self.table[int(mean)]
+            if np.isnan(size):
+                size = self.table[int(mean)] = self.compute(mean)
+            return size
+        if mean in self.lru:
+            self.lru.move_to_end(mean)
+            return self.lru[mean]
+        size = self.lru[mean] = self.compute(mean)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+        return size
+
+    def get_many(self, means):
+        """ Return an array of confidence interval sizes for an array of means """
+        means = np.asarray(means,dtype=float)
+        sizes = np.empty(len(means))
+        in_table = (means == np.floor(means)) & (means > 0) & (means < len(self.table))
+        table_idx = means[in_table].astype(np.int64)
+        missing = np.unique(table_idx[np.isnan(self.table[table_idx])])
+        if len(missing) > 0:
+            self.table[missing] = self.compute(missing)
+        sizes[in_table] = self.table[table_idx]
+        # non-integer means are not worth caching in bulk
+        if not np.all(in_table):
+            sizes[~in_table] = self.compute(means[~in_table])
+        return sizes
+
+# PoissonIntervalCache instances, keyed by (alpha, table_size, lru_size)
+poisson_interval_caches = {}
+
+def get_poisson_interval_cache(alpha, table_size = 100000, lru_size = 10000):
+    """ Return the process-wide PoissonIntervalCache for these parameters """
+    key = (alpha,table_size,lru_size)
+    if key not in poisson_interval_caches:
+        poisson_interval_caches[key] = PoissonIntervalCache(alpha,table_size,lru_size)
+    return poisson_interval_caches[key]
+
+class PeriodIndex(object):
+    """
+    Helper class that maps interval start times to integer period indexes, 
+    for the averaged ("a") mode of the Poisson models. Start times with the same values
+    of the datetime attributes in 'period_list' share a period. 
+    Attributes with a fixed range of values are combined arithmetically
+    (e.g. "hour,weekday" gives 24*7 periods), so 'size' is fixed in advance. 
+    For other attributes, such as "year", periods are numbered in order of appearance,
+    and 'size' grows as they appear.
+    Attributes that are methods, such as "weekday", are called.
+    """
+    # number of values and first value of datetime attributes with a fixed range
+    FIXED_RANGES = {
+            "month":(12,1),
+            "day":(31,1),
+            "weekday":(7,0),
+            "isoweekday":(7,1),
+            "hour":(24,0),
+            "minute":(60,0),
+            "second":(60,0),
+            }
+    # attributes saved in checkpoints
+    state_attributes = ["size","indexes"]
+
+    def __init__(self, period_list):
+        self.period_list = list(period_list)
+        self.getters = []
+        for p in self.period_list:
+            if callable(getattr(datetime.datetime,p,None)):
+                self.getters.append(operator.methodcaller(p))
+            else:
+                self.getters.append(operator.attrgetter(p))
+        self.fixed = all([p in self.FIXED_RANGES for p in self.period_list])
+        if self.fixed:
+            self.ranges = [(getter,) + self.FIXED_RANGES[p] for getter,p in zip(self.getters,self.period_list)]
+            self.size = int(np.prod([self.FIXED_RANGES[p][0] for p in self.period_list]))
+        else:
+            self.size = 0
+        # indexes of the tuples of attribute values seen so far, for other attributes
+        self.indexes = {}
+
+    def __call__(self, start_time):
+        """ Return the period index of 'start_time' """
+        if self.fixed:
+            index = 0
+            for getter,n_values,first_value in self.ranges:
+                index = index*n_values + getter(start_time) - first_value
+            return index
+        key = tuple([getter(start_time) for getter in self.getters])
+        if key not in self.indexes:
+            self.indexes[key] = self.size
+            self.size += 1
+        return self.indexes[key]
+
+def get_period_sums(period_index, nums, denoms, start_time):
+    """ 
+    Return the period index of 'start_time', with the arrays of running sums ('nums') 
+    and numbers of counts ('denoms') per period, extended to hold that period if necessary 
+    """
+    period = period_index(start_time)
+    if period >= len(denoms):
+        size = max(period_index.size,2*len(denoms))
+        nums = np.concatenate((nums,np.zeros((size - len(nums),) + nums.shape[1:])))
+        denoms = np.concatenate((denoms,np.zeros(size - len(denoms),dtype=np.int64)))
+    return period, nums, denoms
 
 class Poisson(object):
     """
@@ -245,14 +923,27 @@ class Poisson(object):
         self.mode = config["mode"]
         self.mean = None
         self.current_count = None
+        self.last_count = None
+        # attributes saved in checkpoints
+        self.state_attributes = ["mean","current_count","last_count"]
         
         if self.mode == "lc":
             self.alpha = float(config["alpha"])
 
         if self.mode == "a":
-            self.periodic_data = collections.defaultdict(dict)
             self.alpha = float(config["alpha"])
             self.period_list = config["period_list"].split(",")
+            # running sum and number of counts in each period
+            self.period_index = PeriodIndex(self.period_list)
+            self.nums = np.zeros(self.period_index.size)
+            self.denoms = np.zeros(self.period_index.size,dtype=np.int64)
+            self.state_attributes += ["period_index","nums","denoms"]
+
+        # confidence interval sizes are shared between instances
+        self.interval_cache = get_poisson_interval_cache(self.alpha,
+                int(config.get("interval_table_size",100000)),
+                int(config.get("interval_cache_size",10000))
+                )
 
     def update(self, **kwargs):
         """
@@ -282,22 +973,69 @@ class Poisson(object):
             self.mean = self.last_count
         
         if self.mode == "a": 
-            # create a ':'-separated string of the start_time attributes, as specified by self.period_list 
-            # this defines the key over which counts will be averaged
-            period = ":".join([str(getattr(start_time,p)) for p in self.period_list])
-            
-            if "num" in self.periodic_data[period]:
-                self.periodic_data[period]["num"] += current_count 
-            else:
-                self.periodic_data[period]["num"] = current_count
-            if "denom" in self.periodic_data[period]:
-                self.periodic_data[period]["denom"] += 1 
-            else:
-                self.periodic_data[period]["denom"] = 1
+            # counts are averaged over start times with the same period index
+            period = self.get_period(start_time)
+            num = self.nums.item(period) + current_count 
+            denom = self.denoms.item(period) + 1 
+            self.nums[period] = num
+            self.denoms[period] = denom
+            self.mean = float(num)/denom
 
-            self.mean = float(self.periodic_data[period]["num"])/self.periodic_data[period]["denom"]
+    def get_period(self, start_time):
+        """ Return the period index of 'start_time', making room for its sums if necessary """
+        period,self.nums,self.denoms = get_period_sums(self.period_index,self.nums,self.denoms,start_time)
+        return period
 
 
+    def update_many(self, **kwargs):
+        """
+        Update the internal model with a sequence of points, 
+        and calculate eta for each one.
+        Keywords "counts" and "interval_start_times" are required.
+        """
+        counts = np.array(kwargs["counts"],dtype=float)
+        start_times = [parse(start_time) if isinstance(start_time,str) else start_time for start_time in kwargs["interval_start_times"]]
+        if len(counts) == 0:
+            self.results = np.zeros(0)
+            return
+
+        # as left by calling 'update' for each point
+        self.last_count = self.current_count if len(counts) == 1 else counts[-2]
+
+        if self.mode == "lc":
+            # the mean for each point is the previous count
+            means = np.empty(len(counts))
+            means[0] = np.nan if self.current_count is None else self.current_count
+            means[1:] = counts[:-1]
+            self.mean = self.last_count
+
+        if self.mode == "a":
+            periods = [self.get_period(start_time) for start_time in start_times]
+            # running sums within each period, continuing from the current state
+            means = np.empty(len(counts))
+            period_idx = collections.defaultdict(list)
+            for i,period in enumerate(periods):
+                period_idx[period].append(i)
+            for period,idx in period_idx.items():
+                nums = np.cumsum(np.concatenate(([self.nums[period]],counts[idx])))[1:]
+                denoms = self.denoms[period] + np.arange(1,len(idx) + 1)
+                means[idx] = nums/denoms
+                self.nums[period] = nums[-1]
+                self.denoms[period] = denoms[-1]
+            self.mean = float(means[-1])
+        
+        self.current_count = counts[-1]
+        
+        # eta = sensitivity / relative confidence interval, for points with a non-zero mean
+        self.results = np.zeros(len(counts))
+        valid = ~np.isnan(means) & (means != 0)
+        sensitivity = np.abs(counts[valid] - means[valid])/means[valid]
+        relative_confidence_interval = self.interval_cache.get_many(means[valid])/means[valid]
+        self.results[valid] = sensitivity/relative_confidence_interval
+
+    def get_results(self):
+        return self.results
+
     def get_relative_confidence_interval(self):
         """
         Get relative (fractional) confidence interval size, 
@@ -305,7 +1043,7 @@ class Poisson(object):
         """
         if self.mean is None or self.mean == 0:
             return None
-        delta_r = dists.poisson.interval(self.alpha,self.mean)[1] - dists.poisson.interval(self.alpha,self.mean)[0]
+        delta_r = self.interval_cache.get(self.mean)
         relative_confidence_interval = delta_r/self.mean
         return relative_confidence_interval
 
@@ -338,3 +1076,210 @@ class Poisson(object):
         if s is None or r is None:
             return 0
         return s/r
+
+class PoissonCounters(object):
+    """
+    Poisson models for many counters whose counts share time steps.
+    The state of all 'n_counters' counters is held in arrays, and 'update' 
+    advances every counter by one time step, with keyword arguments 
+    "counts" (one per counter) and "interval_start_time". 
+    'get_results' returns the array of eta values. Results are identical to those 
+    of a Poisson instance per counter.
+    """
+    def __init__(self, config, n_counters):
+        self.mode = config["mode"]
+        self.alpha = float(config["alpha"])
+        self.n_counters = n_counters
+        # NaN marks counters without a mean
+        self.current_counts = np.full(n_counters,np.nan)
+        self.means = np.full(n_counters,np.nan)
+        self.results = np.zeros(n_counters)
+        # attributes saved in checkpoints
+        self.state_attributes = ["current_counts","means","results"]
+
+        if self.mode == "a":
+            self.period_list = config["period_list"].split(",")
+            # running sums of the counts in each period (rows), for each counter (columns);
+            # the number of counts in a period is the same for all counters
+            self.period_index = PeriodIndex(self.period_list)
+            self.nums = np.zeros((self.period_index.size,n_counters))
+            self.denoms = np.zeros(self.period_index.size,dtype=np.int64)
+            self.state_attributes += ["period_index","nums","denoms"]
+
+        self.interval_cache = get_poisson_interval_cache(self.alpha,
+                int(config.get("interval_table_size",100000)),
+                int(config.get("interval_cache_size",10000))
+                )
+
+    def update(self, **kwargs):
+        counts = np.asarray(kwargs["counts"],dtype=float)
+
+        if self.mode == "lc":
+            self.means = self.current_counts
+
+        if self.mode == "a":
+            start_time = kwargs["interval_start_time"]
+            if isinstance(start_time,str):
+                start_time = parse(start_time)
+            period,self.nums,self.denoms = get_period_sums(self.period_index,self.nums,self.denoms,start_time)
+            self.nums[period] += counts
+            self.denoms[period] += 1
+            self.means = self.nums[period]/self.denoms[period]
+
+        self.current_counts = counts
+
+        # as in Poisson.update_many
+        self.results = np.zeros(self.n_counters)
+        valid = ~np.isnan(self.means) & (self.means != 0)
+        means = self.means[valid]
+        sensitivity = np.abs(counts[valid] - means)/means
+        relative_confidence_interval = self.interval_cache.get_many(means)/means
+        self.results[valid] = sensitivity/relative_confidence_interval
+
+    def get_results(self):
+        return self.results
+
+class LinearRegressionCounters(object):
+    """
+    LinearRegressionModel for many counters whose counts share time steps. 
+    The recent counts and averaged counts of all 'n_counters' counters are held in 
+    (time step x counter) arrays, and 'update' advances every counter by one time step, 
+    with the keyword argument "counts" (one per counter), using running sums.
+    'get_results' returns the array of slopes. Results are identical to those of a
+    LinearRegressionModel instance per counter, with "incremental" set.
+    """
+    # attributes saved in checkpoints
+    state_attributes = ["n_points","counts","averaged_counts","counts_sum","sum_y","sum_xy","n_since_reset","results"]
+
+    def __init__(self, config, n_counters):
+        self.n_counters = n_counters
+        self.n_points = 0
+        set_regression_parameters(self,config)
+        self.results = np.zeros(n_counters)
+
+        # one extra time step is kept, to be dropped from the running sums
+        self.counts = RingBuffer(self.averaging_window_size + 1,shape=(n_counters,)) 
+        regression_capacity = None
+        if self.regression_window_size is not None:
+            regression_capacity = self.regression_window_size + 1
+        self.averaged_counts = RingBuffer(regression_capacity,shape=(n_counters,))
+
+        self.RESET_INTERVAL = 1000
+        self.reset_running_sums()
+
+    def reset_running_sums(self):
+        """ As in LinearRegressionModel.reset_running_sums """
+        self.counts_sum,self.sum_y,self.sum_xy = regression_running_sums(self)
+        self.n_since_reset = 0
+
+    def update(self, **kwargs):
+        counts = np.asarray(kwargs["counts"],dtype=float)
+        self.counts.append(counts)
+        self.n_points += 1
+
+        size = self.averaging_window_size
+        self.counts_sum += counts
+        if self.n_points > size:
+            self.counts_sum -= self.counts[-size-1]
+        if self.n_points >= size:
+            averaged_counts = self.counts_sum/float(size)
+        else:
+            averaged_counts = np.zeros(self.n_counters)
+        self.averaged_counts.append(averaged_counts)
+
+        # as in LinearRegressionModel.update_running_sums
+        m = len(self.averaged_counts) - 1
+        if self.regression_window_size is not None and m >= self.regression_window_size:
+            m = self.regression_window_size - 1
+            self.sum_y -= self.averaged_counts[-self.regression_window_size-1]
+            self.sum_xy -= self.sum_y
+        self.sum_xy += m*averaged_counts
+        self.sum_y += averaged_counts
+        self.n_since_reset += 1
+        if self.n_since_reset >= self.RESET_INTERVAL:
+            self.reset_running_sums()
+
+        self.results = self.get_slopes()
+
+    def get_slopes(self):
+        """ As in LinearRegressionModel.get_incremental_result """
+        m = len(self.averaged_counts)
+        if self.regression_window_size is not None:
+            m = min(m,self.regression_window_size)
+        if self.n_points < self.min_points or m < 2:
+            return np.zeros(self.n_counters)
+        sum_x = m*(m-1)/2.
+        sum_xx = (m-1)*m*(2*m-1)/6.
+        slopes = (m*self.sum_xy - sum_x*self.sum_y)/(m*sum_xx - sum_x*sum_x)
+        if self.norm_by_mean:
+            with np.errstate(divide='ignore',invalid='ignore'):
+                slopes = slopes*m/self.sum_y
+        return slopes
+
+    def get_results(self):
+        return self.results
+
+# multi-counter versions of models, keyed by model name
+multi_counter_models = {
+        "Poisson":PoissonCounters,
+        "LinearRegressionModel":LinearRegressionCounters,
+        }
+
+# model checkpoints: a pickled dictionary with a format name and version, 
+# the model name and configuration, and the model states for a set of counters
+CHECKPOINT_FORMAT = "gnip_trend_detection.checkpoint"
+CHECKPOINT_VERSION = 1
+
+def get_state(model):
+    """ 
+    Return a dictionary of the values of a model's 'state_attributes', 
+    in which objects with their own 'state_attributes' are replaced by their states 
+    """
+    state = {}
+    for name in model.state_attributes:
+        value = getattr(model,name)
+        if hasattr(value,"state_attributes"):
+            value = get_state(value)
+        state[name] = value
+    return state
+
+def set_state(model, state):
+    """ Restore a state returned by 'get_state' to a model with the same configuration """
+    for name in model.state_attributes:
+        value = getattr(model,name)
+        if hasattr(value,"state_attributes"):
+            set_state(value,state[name])
+        else:
+            setattr(model,name,state[name])
+
+def save_checkpoint(file_name, model_name, config, states):
+    """
+    Save a checkpoint of model states. 'states' is a dictionary of counter name 
+    to a tuple of (start time of the last interval analyzed, model state from 'get_state').
+    The file is replaced in one step, so an interrupted save leaves any previous checkpoint intact.
+    """
+    checkpoint = {"format":CHECKPOINT_FORMAT,
+            "version":CHECKPOINT_VERSION,
+            "model_name":model_name,
+            "config":config,
+            "states":states,
+            }
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name,"wb") as f:
+        pickle.dump(checkpoint,f,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file_name,file_name)
+
+def load_checkpoint(file_name, model_name, config):
+    """
+    Return the states saved by 'save_checkpoint', after checking that they were saved 
+    for the same model name and configuration
+    """
+    with open(file_name,"rb") as f:
+        checkpoint = pickle.load(f)
+    if not isinstance(checkpoint,dict) or checkpoint.get("format") != CHECKPOINT_FORMAT:
+        raise ValueError("{} is not a model checkpoint".format(file_name))
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError("checkpoint version {} is not supported (expected {})".format(checkpoint.get("version"),CHECKPOINT_VERSION))
+    if checkpoint["model_name"] != model_name or checkpoint["config"] != config:
+        raise ValueError("{} was saved for a different model configuration".format(file_name))
+    return checkpoint["states"]
@@ -117,35 +117,21 @@ def rebin(**kwargs):
 
         logr.debug("Finished generating grid for {}".format(kwargs["rule_name"]))
 
-        # add data to a dictionary with keys mapped to the grid indicies
+        # add data to a dictionary with keys mapped to the grid indicies;
+        # the grid is uniform, so the first bin touched by an input interval is found arithmetically 
         output_data = collections.defaultdict(float)
         for input_tb,input_count in input_data_sorted:
             logr.debug("input. TB: {}, count: {}".format(input_tb,input_count))
            
-            for grid_tb in grid:
-                if input_tb in grid_tb:
-                    idx = grid.index(grid_tb) 
-                    output_data[idx] += float(input_count)
-                    break
-                elif input_tb.intersects(grid_tb):
-                    # assign partial count of input_tb to grid_tb
-                    idx_lower = grid.index(grid_tb) 
-                    frac_lower = input_tb.get_fraction_overlapped_by(grid_tb)  
-                    output_data[idx_lower] += (float(input_count) * frac_lower)
-                    
-                    try:
-                        idx = idx_lower + 1
-                        frac = input_tb.get_fraction_overlapped_by(grid[idx])  
-                        while frac > 0:
-                            output_data[idx] += (frac * float(input_count))
-                            idx += 1
-                            frac = input_tb.get_fraction_overlapped_by(grid[idx])   
-                    except IndexError:
-                        pass
-                    
-                    break
-                else:
-                    pass
+            idx = (input_tb.start_time - start_time)//grid_dt
+            if input_tb in grid[idx]:
+                output_data[idx] += float(input_count)
+                continue
+            # assign partial counts of input_tb to each grid_tb it overlaps
+            while idx < len(grid) and grid[idx].start_time < input_tb.stop_time:
+                frac = input_tb.get_fraction_overlapped_by(grid[idx])  
+                output_data[idx] += (frac * float(input_count))
+                idx += 1
 
         logr.debug("Completed rebin distribution for {}".format(kwargs["rule_name"])) 
         
@@ -0,0 +1,92 @@
+import numpy as np
+
+class RingBuffer(object):
+    """
+    Array-backed buffer that keeps the most recent 'capacity' values appended to it.
+    If 'capacity' is None, all values are kept.
+    Each value may itself be an array of shape 'shape', such as the counts 
+    of many counters at one time step.
+
+    Values are stored contiguously, so slices are returned as NumPy arrays
+    without copying. Such views are only valid until the next append.
+    """
+    def __init__(self, capacity = None, dtype = float, shape = ()):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        # extra space lets the oldest values be dropped in bulk,
+        # by moving the most recent values to the front of the array
+        if capacity is None:
+            self.data = np.zeros((64,) + self.shape,dtype=dtype)
+        else:
+            self.data = np.zeros((max(2*capacity,1),) + self.shape,dtype=dtype)
+        self.begin = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.begin
+
+    def __repr__(self):
+        return "RingBuffer(capacity={}, values={})".format(self.capacity,self.values())
+
+    def make_room(self, n):
+        """ Ensure that 'n' more values can be written at the end of the data array """
+        if self.end + n <= len(self.data):
+            return
+        if self.capacity is None:
+            new_data = np.zeros((max(2*len(self.data),len(self) + n),) + self.shape,dtype=self.data.dtype)
+            new_data[:len(self)] = self.values()
+        else:
+            keep = min(len(self),self.capacity)
+            new_data = self.data
+            if keep + n > len(self.data):
+                new_data = np.zeros((keep + n,) + self.shape,dtype=self.data.dtype)
+            new_data[:keep] = self.data[self.end-keep:self.end]
+            self.begin = self.end - keep
+        self.data = new_data
+        self.end -= self.begin
+        self.begin = 0
+
+    def append(self, value):
+        self.make_room(1)
+        self.data[self.end] = value
+        self.end += 1
+        if self.capacity is not None and len(self) > self.capacity:
+            self.begin = self.end - self.capacity
+
+    def extend(self, values):
+        values = np.asarray(values,dtype=self.data.dtype).reshape((-1,) + self.shape)
+        if self.capacity is not None:
+            values = values[len(values)-self.capacity:] if len(values) > self.capacity else values
+        self.make_room(len(values))
+        self.data[self.end:self.end+len(values)] = values
+        self.end += len(values)
+        if self.capacity is not None and len(self) > self.capacity:
+            self.begin = self.end - self.capacity
+
+    def values(self):
+        """ Return an array view of the stored values, oldest first """
+        return self.data[self.begin:self.end]
+
+    def tail(self, n):
+        """ Return an array view of the 'n' most recent values (fewer, if fewer are stored) """
+        return self.data[max(self.begin,self.end-n):self.end]
+
+    def tolist(self):
+        return self.values().tolist()
+
+    def sum(self):
+        return self.values().sum()
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def __getitem__(self, key):
+        return self.values()[key]
+
+    def __getstate__(self):
+        """ Pickle only the stored values """
+        return {"capacity":self.capacity,"dtype":self.data.dtype.str,"shape":self.shape,"values":self.values().copy()}
+
+    def __setstate__(self, state):
+        self.__init__(state["capacity"],state["dtype"],state["shape"])
+        self.extend(state["values"])
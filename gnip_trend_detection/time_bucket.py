@@ -1,21 +1,28 @@
 import datetime
 
+import numpy as np
+
+from .binning import to_epoch, from_epoch, grid_overlap_arrays
+
 class TimeBucket:
+    __slots__ = ('start_time','stop_time')
+
+    # format of string start and stop times, and of the representation
+    datetime_format = "%Y%m%d%H%M%S"
+
     def __init__(self,start_time,stop_time, datetime_format = None):
         
-        if datetime_format is not None:
-            self.datetime_format = datetime_format
-        else:
-            self.datetime_format = "%Y%m%d%H%M%S"
+        if datetime_format is None:
+            datetime_format = self.datetime_format
 
         if isinstance(start_time,datetime.datetime):
             self.start_time = start_time
         else:
-            self.start_time = datetime.datetime.strptime(start_time,self.datetime_format)
+            self.start_time = datetime.datetime.strptime(start_time,datetime_format)
         if isinstance(stop_time,datetime.datetime):
             self.stop_time = stop_time
         else:
-            self.stop_time = datetime.datetime.strptime(stop_time,self.datetime_format)
+            self.stop_time = datetime.datetime.strptime(stop_time,datetime_format)
     
         # sanity check
         assert self.stop_time > self.start_time
@@ -56,13 +63,13 @@ class TimeBucket:
 
     def __ge__(self, obj):
         if isinstance(obj,TimeBucket):
-            return self.__gt__(obj) or self.__eq__(obj)
+            return obj.stop_time < self.start_time or (obj.start_time == self.start_time and obj.stop_time == self.stop_time)
         else:
             raise NotImplemented
     
     def __le__(self, obj):
         if isinstance(obj,TimeBucket):
-            return self.__lt__(obj) or self.__eq__(obj)
+            return self.stop_time < obj.start_time or (obj.start_time == self.start_time and obj.stop_time == self.stop_time)
         else:
             raise NotImplemented
 
@@ -106,12 +113,8 @@ class TimeBucket:
     
     def intersects(self, obj):
         if isinstance(obj,TimeBucket):
-            return self.lowerlaps(obj) or self.upperlaps(obj) or obj.lowerlaps(self) or obj.upperlaps(self) or self in obj or obj in self
-            #cond1 = self.start_time >= obj.start_time and self.start_time <= obj.stop_time
-            #cond2 = self.stop_time >= obj.start_time and self.stop_time <= obj.stop_time
-            #cond3 = obj.start_time >= self.start_time and obj.start_time <= self.stop_time
-            #cond4 = obj.stop_time >= self.start_time and obj.stop_time <= self.stop_time
-            #return cond1 or cond2 or cond3 or cond4
+            # equivalent to: self.lowerlaps(obj) or self.upperlaps(obj) or obj.lowerlaps(self) or obj.upperlaps(self) or self in obj or obj in self
+            return self.start_time < obj.stop_time and obj.start_time < self.stop_time
         else:
             raise NotImplemented
 
@@ -128,3 +131,62 @@ class TimeBucket:
             return float(obj.size().total_seconds() / self.size().total_seconds())
         else:
             return float(0)
+
+
+class TimeBucketArray(object):
+    """
+    Columnar, array-backed collection of time buckets, 
+    with a vectorized TimeBucket containment test and a mapping onto uniform grids.
+    Start and stop times are stored as seconds since the Unix epoch; 
+    integer arrays are used unless floating-point times are passed in.
+    """
+    __slots__ = ('start','stop')
+
+    def __init__(self, start, stop):
+        self.start = self._as_epochs(start)
+        self.stop = self._as_epochs(stop)
+        
+        # sanity check
+        assert np.all(self.stop > self.start)
+
+    @staticmethod
+    def _as_epochs(times):
+        times = np.asarray(times)
+        if not np.issubdtype(times.dtype,np.floating):
+            times = times.astype(np.int64)
+        return times
+
+    def __len__(self):
+        return len(self.start)
+
+    def __getitem__(self, key):
+        """ Return a TimeBucket for an integer key, and a TimeBucketArray otherwise """
+        if isinstance(key,(int,np.integer)):
+            return TimeBucket(from_epoch(self.start[key]),from_epoch(self.stop[key]))
+        return TimeBucketArray(self.start[key],self.stop[key])
+    
+    def __repr__(self):
+        return "TimeBucketArray({} buckets)".format(len(self))
+
+    def size(self):
+        return self.stop - self.start
+
+    @staticmethod
+    def _bounds(obj):
+        if isinstance(obj,TimeBucketArray):
+            return obj.start, obj.stop
+        if isinstance(obj,TimeBucket):
+            return to_epoch(obj.start_time), to_epoch(obj.stop_time)
+        raise TypeError("expected TimeBucket or TimeBucketArray, got {}".format(type(obj)))
+
+    def is_in(self, obj):
+        """ Element-wise equivalent of 'self[i] in obj' """
+        start, stop = self._bounds(obj)
+        return (self.start >= start) & (self.stop <= stop)
+
+    def grid_overlaps(self, grid_start, grid_dt):
+        """ 
+        Map the buckets onto the uniform grid that starts at 'grid_start' with bins of size 'grid_dt'.
+        See 'binning.grid_overlap_arrays'.
+        """
+        return grid_overlap_arrays(self.start,self.size(),grid_start,grid_dt)
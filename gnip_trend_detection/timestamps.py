@@ -0,0 +1,78 @@
+"""
+Fast parsing of interval start time stamps.
+
+Parsing every time stamp with dateutil is slow, but the time stamps in a single
+input file almost always share one format. A TimestampParser sniffs the format
+from the first time stamp it sees, and then uses a fixed-format parser for
+all subsequent time stamps. Any time stamp that the fixed-format parser
+can't handle is passed to dateutil.
+"""
+
+import datetime
+from dateutil.parser import parse as dt_parser
+
+def parse_compact(time_stamp):
+    """ Parse the compact '%Y%m%d%H%M%S' format """
+    if len(time_stamp) != 14 or not time_stamp.isdigit():
+        raise ValueError("'{}' is not a compact time stamp".format(time_stamp))
+    return datetime.datetime(int(time_stamp[0:4]),
+            int(time_stamp[4:6]),
+            int(time_stamp[6:8]),
+            int(time_stamp[8:10]),
+            int(time_stamp[10:12]),
+            int(time_stamp[12:14])
+            )
+
+def parse_iso(time_stamp):
+    """ Parse ISO-8601 time stamps, such as those returned by 'str(datetime)' """
+    return datetime.datetime.fromisoformat(time_stamp)
+
+def strptime_parser(datetime_format):
+    """ Return a parser for a 'strptime'-style format """
+    def parser(time_stamp):
+        return datetime.datetime.strptime(time_stamp,datetime_format)
+    return parser
+
+# fixed-format parsers, in the order that they are tried
+PARSERS = [
+        parse_compact,
+        parse_iso,
+        strptime_parser("%m/%d/%Y %H:%M:%S"),
+        ]
+
+class TimestampParser(object):
+    """
+    Callable that parses a time stamp string and returns a datetime.
+    Create one instance per input source, since the format is
+    determined by the first time stamp that is parsed.
+    """
+    def __init__(self):
+        self.parser = None
+        self.n_fallbacks = 0
+
+    def sniff(self, time_stamp):
+        """
+        Choose the first fixed-format parser whose result
+        agrees with dateutil's for 'time_stamp'; use dateutil if there is none.
+        Return dateutil's result.
+        """
+        dt = dt_parser(time_stamp)
+        self.parser = dt_parser
+        for parser in PARSERS:
+            try:
+                if parser(time_stamp) == dt:
+                    self.parser = parser
+                    break
+            except ValueError:
+                pass
+        return dt
+
+    def __call__(self, time_stamp):
+        time_stamp = time_stamp.strip()
+        if self.parser is None:
+            return self.sniff(time_stamp)
+        try:
+            return self.parser(time_stamp)
+        except ValueError:
+            self.n_fallbacks += 1
+            return dt_parser(time_stamp)
@@ -1,2 +1,13 @@
 def is_same(first_str,second_str):
     return first_str.strip().rstrip() == second_str.strip().rstrip()
+
+# string values that are read as true
+TRUE_VALUES = ("1","true","t","yes","y")
+
+def is_true(value):
+    """ Return True if 'value' is one of TRUE_VALUES, in any case """
+    return str(value).strip().lower() in TRUE_VALUES
+
+def config_flag(config, key, default=False):
+    """ Return True if the config value for 'key' is one of TRUE_VALUES, in any case """
+    return is_true(config.get(key,default))
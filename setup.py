@@ -16,5 +16,6 @@ setup(name='gnip_trend_detection'
             'trend_analyze_many.py',
             'time_series_correlations.py',
             'trend_detector.py',
+            'trend_library.py',
             ]  
         )
@@ -0,0 +1,36 @@
+import datetime
+import random
+
+import pytest
+
+from gnip_trend_detection.analysis import rebin, rebin_stream
+
+def random_rows(rng):
+    """ time-ordered (start time, duration, count) rows, with gaps and zero counts """
+    # intervals mostly start on whole minutes, so that many end on bin boundaries
+    start_time = datetime.datetime(2014,8,26,rng.randint(0,23),rng.randint(0,59),rng.choice([0,0,0,rng.randint(0,59)]))
+    rows = []
+    for i in range(rng.randint(1,40)):
+        duration = rng.choice([1,60,195,300,3600,9000])
+        rows.append((start_time.strftime("%Y%m%d%H%M%S"),str(duration),str(rng.choice([0,0,1,5,17,300]))))
+        start_time += datetime.timedelta(seconds=rng.choice([0,60,60,195,300,3600,20000]))
+    return rows
+
+@pytest.mark.parametrize("rows,kwargs",[
+    # a last bin that only receives an explicit zero count
+    ([("20150601031700","600","5"),("20150601041700","600","7"),("20150601051700","600","0")],
+        dict(binning_unit="hours")),
+    # a zero-count bin after the last occupied bin
+    ([("20140826000000","60","0"),("20140826020100","300","17")],
+        dict(binning_unit="minutes",n_binning_unit=1)),
+    ])
+def test_stream_matches_rebin(rows,kwargs):
+    assert list(rebin_stream(iter(rows),**kwargs)) == rebin(rows,**kwargs)
+
+@pytest.mark.parametrize("seed",range(300))
+def test_stream_matches_rebin_random(seed):
+    rng = random.Random(seed)
+    rows = random_rows(rng)
+    kwargs = dict(binning_unit=rng.choice(["minutes","hours"]),n_binning_unit=rng.choice([1,1,2,5]))
+    chunk_size = rng.choice([1,3,1000])
+    assert list(rebin_stream(iter(rows),chunk_size=chunk_size,**kwargs)) == rebin(rows,**kwargs)
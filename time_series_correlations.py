@@ -7,10 +7,11 @@ import operator
 import argparse
 import csv
 import fileinput
-from dateutil.parser import parse as dt_parse
 
 import numpy as np
 
+from gnip_trend_detection.timestamps import TimestampParser
+
 """
 Calculate Pearson's correlation coefficient 
 for all pairs of time series
@@ -27,9 +28,10 @@ else:
     line_generator = csv.reader(fileinput.input(args.input_file_names))
 
 counters = collections.defaultdict(list)
+time_parser = TimestampParser()
 
 for line in line_generator:
-    dt = dt_parse(line[0])
+    dt = time_parser(line[0])
     tb_size_in_sec,count,counter = line[1:]
     counters[counter].append(int(count))
 
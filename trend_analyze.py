@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+import os
 import csv
 import importlib
 import argparse
@@ -10,7 +11,7 @@ try:
 except ImportError:
     import configparser
     
-from gnip_trend_detection.analysis import analyze
+from gnip_trend_detection.analysis import analyze, analyze_from_checkpoint
 from gnip_trend_detection import models
 
 # logging
@@ -26,6 +27,8 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-i","--input-file",dest="input_file_name",default=None) 
 parser.add_argument("-o","--analyzed-file",dest="analyzed_data_file",default=None) 
 parser.add_argument("-c","--config-file",dest="config_file_name",default="config.cfg",help="get configuration from this file")
+parser.add_argument("-k","--checkpoint-file",dest="checkpoint_file_name",default=None,
+        help="resume from the model state in this file, if it exists, analyzing only later intervals; then save the new state to it")
 parser.add_argument("-v","--verbose",dest="verbose",action="store_true",default=False)
 args = parser.parse_args()
 
@@ -47,7 +50,19 @@ else:
     generator = csv.reader(sys.stdin)
 
 # do the analysis
-plotable_data = analyze(generator,model)
+if args.checkpoint_file_name is None:
+    plotable_data = analyze(generator,model)
+else:
+    # the checkpoint holds a single series, with no counter name
+    checkpoint_state = None
+    if os.path.exists(args.checkpoint_file_name):
+        checkpoint_states = models.load_checkpoint(args.checkpoint_file_name,model_name,model_config)
+        if None not in checkpoint_states:
+            logger.error('{} was not written by trend_analyze.py (it holds the states of named counters)'.format(args.checkpoint_file_name))
+            sys.exit(1)
+        checkpoint_state = checkpoint_states[None]
+    plotable_data, checkpoint_state = analyze_from_checkpoint(generator,model,checkpoint_state)
+    models.save_checkpoint(args.checkpoint_file_name,model_name,model_config,{None:checkpoint_state})
 
 # output
 if args.analyzed_data_file is not None:
@@ -5,9 +5,19 @@
 This script operates on a set of CSV-fromatted time series,
 such as those produced by the Gnip-Analysis-Pipeline package.
 
-The script re-bins the data on multiple processes using multiprocessing.
+The script re-bins the data for all counters in a single pass over the input.
 The resulting data are then analyzed point-by-point with a trend detection
-alogrithm (also in parallel), and plotted.
+alogrithm (in parallel, using multiprocessing), and plotted.
+Each worker process sets up the model configuration once, and analyzes each 
+counter with a new model instance. Read-only model data, such as the 
+WeightedDataTemplates library, are loaded once per worker.
+With '--batch-size', each task analyzes a batch of counters together, one time
+step at a time; WeightedDataTemplates then scores all the counters in a batch
+against the library at once. For models with a multi-counter version 
+(Poisson, LinearRegressionModel), batches of counters that share time steps are 
+analyzed with a single multi-counter model instance.
+With '-k', the model state of each counter is saved in a checkpoint file after the analysis;
+the next run resumes from it, and analyzes only the intervals after those in the checkpoint.
 
 Command-line argument control the input, output, and config file names,
 as well as the switches for doing re-bin, analysis, and plotting.
@@ -26,7 +36,6 @@ import argparse
 import logging
 import sys 
 import os
-import copy
 import csv
 import fileinput
 import collections
@@ -35,8 +44,12 @@ try:
     import ConfigParser as configparser
 except ImportError:
     import configparser
-from gnip_trend_detection.analysis import rebin
+from gnip_trend_detection.analysis import rebin_many
 from gnip_trend_detection.analysis import analyze as analyzer
+from gnip_trend_detection.analysis import analyze_many as batch_analyzer
+from gnip_trend_detection.analysis import analyze_counters as counters_analyzer
+from gnip_trend_detection.analysis import share_time_steps
+from gnip_trend_detection.analysis import analyze_from_checkpoint as checkpoint_analyzer
 from gnip_trend_detection.analysis import plot as plotter
 from gnip_trend_detection import models,utils
 
@@ -73,6 +86,10 @@ parser.add_argument("-p",
 parser.add_argument("--rebin",dest="do_rebin",action="store_true",default=False,help="do rebin")   
 parser.add_argument("--analysis",dest="do_analysis",action="store_true",default=False,help="do analysis")   
 parser.add_argument("--plot",dest="do_plot",action="store_true",default=False,help="do plotting")   
+parser.add_argument("--batch-size",dest="batch_size",type=int,default=None,
+        help="analyze counters in batches of this size, updating each batch together")   
+parser.add_argument("-k","--checkpoint-file",dest="checkpoint_file_name",default=None,
+        help="resume from the model states in this file, if it exists, analyzing only later intervals; then save the new states to it")   
 parser.add_argument("-v","--verbose",dest="verbose",action="store_true",default=False)   
 args = parser.parse_args()
 
@@ -115,6 +132,10 @@ if args.do_analysis and not args.do_plot and args.analysis_output_file_name is N
     logger.error('No analysis output file specified or further plotting requested, so analysis results will be lost!')
     sys.exit(1)
 
+if args.checkpoint_file_name is not None and args.batch_size is not None:
+    logger.error('Checkpoints are not supported with --batch-size.')
+    sys.exit(1)
+
 # warn if options configure ambiguous input 
 if args.do_analysis and args.do_rebin and args.analysis_input_file_name is not None:
     logger.error('Input to analysis step is ambigious. Exiting.')
@@ -125,17 +146,21 @@ if args.do_rebin and args.do_plot and args.plot_input_file_name is not None:
 
 # process input data if available
 input_data = None
+counters = None
 if args.input_file_names is not None:
+    try:
+        counters = [counter.rstrip('\n') for counter in open(rebin_config["counters_file_name"]) ] 
+    except KeyError:
+        pass
+
+# rebinning reads the input in a single pass, so only load the data per counter if it will be analyzed directly
+if args.input_file_names is not None and not args.do_rebin:
     logger.info('Loading CSV data...')  
     input_data = collections.defaultdict(list)
     
     input_generator = csv.reader(fileinput.input(args.input_file_names),
             quoting=csv.QUOTE_NONE # this ignores quotes that are part of the counter name
             )
-    try:
-        counters = [counter.rstrip('\n') for counter in open(rebin_config["counters_file_name"]) ] 
-    except KeyError:
-        counters = None
         
     for line in input_generator:
         try:
@@ -148,39 +173,58 @@ if args.input_file_names is not None:
 
     logger.info('Finished loading CSV data')
 
-# set up the multiprocessing stuff
-pool = mp.Pool()
+# model configuration in each worker process
+worker_model_name = None
+worker_model_config = None
+
+def init_worker(model_name, model_config):
+    """ Set up the model configuration in a worker process """
+    global worker_model_name, worker_model_config
+    worker_model_name = model_name
+    worker_model_config = model_config
+    # load any shared model data now, rather than in the first task
+    getattr(models,worker_model_name)(config=worker_model_config)
+
+def analyze_counter(counter_data):
+    """ Analyze the data for one counter with a new model instance """
+    model = getattr(models,worker_model_name)(config=worker_model_config) 
+    return analyzer(counter_data,model)
+
+def analyze_counter_from_checkpoint(counter_data, checkpoint_state):
+    """ 
+    Analyze the data for one counter with a new model instance, resuming from its checkpoint state; 
+    return the results and the new checkpoint state 
+    """
+    model = getattr(models,worker_model_name)(config=worker_model_config) 
+    return checkpoint_analyzer(counter_data,model,checkpoint_state)
+
+def analyze_counter_batch(batch_data):
+    """ 
+    Analyze the data for a batch of counters together, with a new multi-counter model instance
+    if possible, or with a new model instance per counter 
+    """
+    if worker_model_name in models.multi_counter_models and share_time_steps(batch_data):
+        engine = models.multi_counter_models[worker_model_name](worker_model_config,len(batch_data))
+        return counters_analyzer(batch_data,engine)
+    counter_models = {}
+    for counter in batch_data:
+        counter_models[counter] = getattr(models,worker_model_name)(config=worker_model_config) 
+    return batch_analyzer(batch_data,counter_models)
 
 rebin_output_data = None
 if args.do_rebin:
     logger.info('Re-binning...')
     
-    if input_data is None:
+    if args.input_file_names is None:
         sys.stderr.write("Input file(s) must be specified with '-i'. Exiting.\n")
         sys.exit(1)
 
-    rebin_results = {}
-    for counter,data in input_data.items(): 
-        # set up config for this job
-        this_config = copy.copy(rebin_config)
-        rebin_results[counter] = pool.apply_async(rebin,(data,),this_config) 
-
-    rebin_output_data = {}
-    num_rebin_results = len(rebin_results)
-    while num_rebin_results != 0:
-        if datetime.datetime.now().second%10 == 0:
-            if num_rebin_results != 1:
-                logger.info(str(num_rebin_results) + ' rebins remaining') 
-            else:
-                # print the name of any 1 remaining job
-                logger.info(str(num_rebin_results) + ' rebins remaining ({})'.format([name for name in rebin_results.keys()][0]))  
-            time.sleep(1)
-        logger.debug("{} results unfinished".format(num_rebin_results))
-        for counter,result in list(rebin_results.items()):
-            if result.ready():
-                rebin_output_data[counter] = result.get()
-                del rebin_results[counter]
-        num_rebin_results = len(rebin_results)
+    # all counters are rebinned in one pass over the input, on a shared grid
+    input_generator = csv.reader(fileinput.input(args.input_file_names),
+            quoting=csv.QUOTE_NONE # this ignores quotes that are part of the counter name
+            )
+    rebin_output_data = rebin_many(input_generator,counters=counters,**rebin_config)
+    logger.info('Finished re-binning {} counters'.format(len(rebin_output_data)))
     
     if args.rebin_output_file_name is not None:
         json.dump(rebin_output_data,open(args.rebin_output_file_name,'w'))
@@ -190,8 +234,8 @@ if args.do_analysis:
    
     logger.info('Analyzing...')
     
-    # get and configure the model
-    model = getattr(models,model_name)(config=model_config) 
+    # set up the multiprocessing stuff; each worker configures the model
+    pool = mp.Pool(initializer=init_worker,initargs=(model_name,model_config))
 
     # get input data
     if rebin_output_data is None:
@@ -208,11 +252,31 @@ if args.do_analysis:
     else:
         analyzer_input_data = rebin_output_data
 
+    # model states for each counter, keyed by counter name
+    checkpoint_states = None
+    if args.checkpoint_file_name is not None:
+        checkpoint_states = {}
+        if os.path.exists(args.checkpoint_file_name):
+            checkpoint_states = models.load_checkpoint(args.checkpoint_file_name,model_name,model_config)
+            logger.info('Resuming from checkpoint with {} counters'.format(len(checkpoint_states)))
+
     analyzer_results = {}
-    for counter, counter_data in analyzer_input_data.items():
-        if len(counter_data) == 0:
-            continue
-        analyzer_results[counter] = pool.apply_async(analyzer,(counter_data,model)) 
+    if checkpoint_states is not None:
+        for counter, counter_data in analyzer_input_data.items():
+            if len(counter_data) == 0:
+                continue
+            analyzer_results[counter] = pool.apply_async(analyze_counter_from_checkpoint,(counter_data,checkpoint_states.get(counter))) 
+    elif args.batch_size is None:
+        for counter, counter_data in analyzer_input_data.items():
+            if len(counter_data) == 0:
+                continue
+            analyzer_results[counter] = pool.apply_async(analyze_counter,(counter_data,)) 
+    else:
+        counters_with_data = [counter for counter, counter_data in analyzer_input_data.items() if len(counter_data) != 0]
+        for lower in range(0,len(counters_with_data),args.batch_size):
+            batch_data = dict((counter,analyzer_input_data[counter]) for counter in counters_with_data[lower:lower+args.batch_size])
+            batch_name = "batch of {} counters starting with {}".format(len(batch_data),counters_with_data[lower])
+            analyzer_results[batch_name] = pool.apply_async(analyze_counter_batch,(batch_data,)) 
 
     analyzer_output_data = {}
     num_analyzer_results = len(analyzer_results)
@@ -227,9 +291,18 @@ if args.do_analysis:
         logger.debug("{} results unfinished".format(num_analyzer_results))
         for counter,result in list(analyzer_results.items()):
             if result.ready():
-                analyzer_output_data[counter] = result.get()
+                if checkpoint_states is not None:
+                    analyzer_output_data[counter], checkpoint_states[counter] = result.get()
+                elif args.batch_size is None:
+                    analyzer_output_data[counter] = result.get()
+                else:
+                    analyzer_output_data.update(result.get())
                 del analyzer_results[counter]
         num_analyzer_results = len(analyzer_results)
+    pool.close()
+
+    if checkpoint_states is not None:
+        models.save_checkpoint(args.checkpoint_file_name,model_name,model_config,checkpoint_states)
     
     if args.analysis_output_file_name is not None:
         json.dump(analyzer_output_data,open(args.analysis_output_file_name,'w'))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import pickle
+import argparse
+import logging
+import csv
+import json
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+from gnip_trend_detection.library import save_array_library, load_array_library, save_library, build_library
+from gnip_trend_detection.utils import is_true, config_flag
+
+"""
+Manage libraries of reference series for the WeightedDataTemplates model.
+
+Commands:
+    build: build a library from labelled series, transforming them in parallel,
+        using the configuration in the WeightedDataTemplates_model section of the config file
+    convert: convert a pickled Library to an array library directory,
+        which WeightedDataTemplates memory-maps when "library_file_name" points to it
+
+Labelled series are read from CSV files, with one series per line:
+    trend flag (1 or 0),count,count,...
+or from JSON-lines files (ending in ".jsonl"), with one series per line:
+    {"trend": true, "counts": [count, count, ...]}
+"""
+
+# logging
+logger = logging.getLogger("library")
+if logger.handlers == []:
+    fmtr = logging.Formatter('%(asctime)s %(name)s - %(levelname)s - %(message)s')
+    hndlr = logging.StreamHandler()
+    hndlr.setFormatter(fmtr)
+    logger.addHandler(hndlr)
+
+def read_labelled_series(file_names):
+    """ Generate (is_trend, counts) pairs from CSV or JSON-lines files """
+    for file_name in file_names:
+        with open(file_name) as f:
+            if file_name.endswith(".jsonl"):
+                for line in f:
+                    if line.strip() == "":
+                        continue
+                    record = json.loads(line)
+                    yield config_flag(record,"trend"), [float(count) for count in record["counts"]]
+            else:
+                for line in csv.reader(f):
+                    if len(line) == 0:
+                        continue
+                    yield is_true(line[0]), [float(count) for count in line[1:]]
+
+def build(args):
+    config = configparser.ConfigParser()
+    config.read(args.config_file_name)
+    library_config = dict(config.items("WeightedDataTemplates_model"))
+    library = build_library(read_labelled_series(args.input_file_names),library_config,
+            processes=args.processes,chunk_size=args.chunk_size)
+    # a pickle file, or otherwise an array library directory
+    if args.output_name.endswith(".pkl"):
+        save_library(library,args.output_name)
+    else:
+        save_array_library(library,args.output_name,series_length=args.series_length)
+    logger.info("wrote {} trends and {} non-trends to {}".format(
+        len(library.trends),len(library.non_trends),args.output_name))
+
+def convert(args):
+    library = pickle.load(open(args.input_file_name,'rb'))
+    save_array_library(library,args.output_dir_name,series_length=args.series_length)
+    # check that the result can be loaded
+    array_library = load_array_library(args.output_dir_name)
+    logger.info("wrote {} trends and {} non-trends to {}".format(
+        len(array_library.trend_matrix),len(array_library.non_trend_matrix),args.output_dir_name))
+
+# parse arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-v","--verbose",dest="verbose",action="store_true",default=False)
+subparsers = parser.add_subparsers(dest="command")
+subparsers.required = True
+
+build_parser = subparsers.add_parser("build",help="build a library from labelled series")
+build_parser.add_argument("-c","--config-file",dest="config_file_name",default="config.cfg")
+build_parser.add_argument("-i","--input-file",dest="input_file_names",nargs="+",required=True,
+        help="CSV or JSON-lines (.jsonl) files of labelled series")
+build_parser.add_argument("-o","--output",dest="output_name",default="library.pkl",
+        help="output pickle file (.pkl), or array library directory")
+build_parser.add_argument("-l","--series-length",dest="series_length",type=int,default=None,
+        help="for array libraries, also save all subseries of this length")
+build_parser.add_argument("-n","--processes",dest="processes",type=int,default=None,
+        help="number of processes (default: number of CPUs)")
+build_parser.add_argument("--chunk-size",dest="chunk_size",type=int,default=100,
+        help="number of series per task")
+build_parser.set_defaults(func=build)
+
+convert_parser = subparsers.add_parser("convert",help="convert a pickled library to an array library")
+convert_parser.add_argument("-i","--input-file",dest="input_file_name",default="library.pkl")
+convert_parser.add_argument("-o","--output-dir",dest="output_dir_name",required=True)
+convert_parser.add_argument("-l","--series-length",dest="series_length",type=int,default=None,
+        help="also save all subseries of this length; should match the model's 'series_length'")
+convert_parser.set_defaults(func=convert)
+
+args = parser.parse_args()
+if args.verbose:
+    logger.setLevel(logging.INFO)
+
+args.func(args)
@@ -11,7 +11,7 @@ try:
 except ImportError:
     import configparser
 
-from gnip_trend_detection.analysis import rebin
+from gnip_trend_detection.analysis import rebin, rebin_stream
 from gnip_trend_detection import utils
 
 """
@@ -51,6 +51,8 @@ parser.add_argument("-d","--input-file-base-dir",dest="input_file_base_dir",defa
 parser.add_argument("-p","--input-file-postfix",dest="input_file_postfix",default="counts")    
 parser.add_argument("-o","--output-file",dest="output_file_name",default=None)    
 parser.add_argument("-n","--counter-name",dest="counter_name",default=None)    
+parser.add_argument("-s","--stream",dest="stream",action="store_true",default=False,
+        help="emit each bin as soon as it is complete; input must be time-ordered, within the 'lateness' config parameter")    
 parser.add_argument("-v","--verbose",dest="verbose",action="store_true",default=False)    
 args = parser.parse_args()
 
@@ -82,7 +84,10 @@ else:
     kwargs = {}
 
 # do the rebin
-data = rebin(input_generator, **kwargs)
+if args.stream:
+    data = rebin_stream(input_generator, **kwargs)
+else:
+    data = rebin(input_generator, **kwargs)
 
 # do output
 if args.output_file_name is not None: